@@ -152,21 +152,32 @@ def main():
     # Fetch data
     with st.spinner('Loading bike share data...'):
         try:
-            data_df = query_station_status(STATION_STATUS_URL)
-            latlon_df = get_station_latlon(STATION_INFO_URL)
-            data = join_latlon(data_df, latlon_df)
+            # The background poller keeps a shared snapshot fresh for every session
+            start_feed_poller(STATION_STATUS_URL, STATION_INFO_URL)
+            snapshot = get_latest_snapshot(timeout=15)
+            
+            if snapshot is not None:
+                data = snapshot['data']
+                metrics = snapshot['metrics']
+            else:
+                # No snapshot published yet, fall back to a direct fetch
+                data_df, latlon_df, errors = fetch_station_frames(STATION_STATUS_URL, STATION_INFO_URL)
+                for feed, error in errors.items():
+                    st.error(f"Error loading station {feed}: {error}")
+                data = join_latlon(data_df, latlon_df)
+                metrics = compute_station_metrics(data)
         except Exception as e:
             st.error(f"Error loading data: {str(e)}")
             return
     
     # Status section
-    create_status_section(data)
+    create_status_section(metrics)
     
     # Sidebar for bike finding
     create_sidebar_find_bike(data)
     
     # Map section
-    create_map_section(data)
+    create_map_section(data, metrics)
     
     # Footer
     create_footer()
@@ -190,16 +201,16 @@ def create_header():
     # Date
     st.markdown(f'<div style="text-align: center; margin: 2rem 0;"><div style="font-family: monospace; font-size: 0.875rem; background: rgba(255,255,255,0.5); padding: 0.75rem 1.5rem; border: 2px solid #2C2416; border-radius: 8px; display: inline-block;">🕐 {current_time}</div></div>', unsafe_allow_html=True)
 
-def create_status_section(data):
+def create_status_section(metrics):
     """Create the status section"""
-    # Calculate metrics
-    total_bikes = sum(data['num_bikes_available'])
-    stations_with_bikes = len(data[data['num_bikes_available'] > 0])
-    stations_with_docks = len(data[data['num_docks_available'] > 0])
-    total_stations = len(data)
+    # Metrics are precomputed with each snapshot
+    total_bikes = metrics['total_bikes']
+    stations_with_bikes = metrics['stations_with_bikes']
+    stations_with_docks = metrics['stations_with_docks']
+    total_stations = metrics['total_stations']
     
-    bike_availability_rate = (stations_with_bikes / total_stations) * 100
-    dock_availability_rate = (stations_with_docks / total_stations) * 100
+    bike_availability_rate = metrics['bike_availability_rate']
+    dock_availability_rate = metrics['dock_availability_rate']
     
     # Status intro
     st.markdown('<div style="text-align: center; margin: 3rem 0 2rem;"><div style="display: inline-block; padding: 0.5rem 1.5rem; border: 2px solid #2E5C8A; border-radius: 50px; font-size: 0.75rem; text-transform: uppercase; letter-spacing: 0.2em; color: #2E5C8A; background: rgba(46,92,138,0.1); font-weight: 600;">🧭 Real-Time System Status</div></div>', unsafe_allow_html=True)
@@ -221,9 +232,9 @@ def create_status_section(data):
         </div>
         ''', unsafe_allow_html=True)
     
-    # Calculate ebike metrics
-    total_ebikes = data['ebike'].sum()
-    stations_with_ebikes = len(data[data['ebike'] > 0])
+    # E-bike metrics
+    total_ebikes = metrics['total_ebikes']
+    stations_with_ebikes = metrics['stations_with_ebikes']
     
     with col2:
         st.markdown(f'''
@@ -289,7 +300,7 @@ def create_sidebar_find_bike(data):
     # Action selection
     st.sidebar.markdown("### What do you need?")
     
-    col1, col2 = st.sidebar.columns(2)
+    col1, col2, col3 = st.sidebar.columns(3)
     with col1:
         if st.button("🚲 Rent", key="rent_btn", use_container_width=True):
             st.session_state.action = "rent"
@@ -298,10 +309,16 @@ def create_sidebar_find_bike(data):
         if st.button("🔒 Return", key="return_btn", use_container_width=True):
             st.session_state.action = "return"
     
+    with col3:
+        if st.button("🗺️ Trip", key="trip_btn", use_container_width=True):
+            st.session_state.action = "trip"
+    
     # Show current selection
     current_action = st.session_state.get('action', 'rent')
     if current_action == 'rent':
         st.sidebar.success("🚲 **Renting a bike**")
+    elif current_action == 'trip':
+        st.sidebar.success("🗺️ **Riding from A to B**")
     else:
         st.sidebar.info("🔒 **Returning a bike**")
     
@@ -328,8 +345,18 @@ def create_sidebar_find_bike(data):
     with col2:
         province = st.text_input("Province", value="Ontario", disabled=True)
     
-    # Bike type selection (only for rent)
-    if current_action == 'rent':
+    # Destination (only for trips)
+    destination = ""
+    if current_action == 'trip':
+        st.sidebar.markdown("### Where to?")
+        destination = st.sidebar.text_input(
+            "Destination Address",
+            placeholder="100 Queen Street West, Toronto",
+            help="Enter where you are riding to in Toronto"
+        )
+    
+    # Bike type selection (only when renting)
+    if current_action in ('rent', 'trip'):
         st.sidebar.markdown("---")
         st.sidebar.markdown("### Bike Preference")
         
@@ -350,14 +377,21 @@ def create_sidebar_find_bike(data):
     st.sidebar.markdown("---")
     
     # Action button
-    action_text = "🚀 Find My Bike!" if current_action == 'rent' else "🎯 Find a Dock!"
+    action_text = {'rent': "🚀 Find My Bike!", 'trip': "🗺️ Plan My Trip!"}.get(current_action, "🎯 Find a Dock!")
     
     if st.sidebar.button(action_text, key="journey_btn", use_container_width=True, type="primary"):
-        if address.strip():
-            with st.spinner(f'🔍 Finding your {current_action}...'):
-                process_location_request(address, city, province, current_action, data)
-        else:
+        if not address.strip():
             st.sidebar.error("⚠️ Please enter your street address")
+        elif current_action == 'trip' and not destination.strip():
+            st.sidebar.error("⚠️ Please enter your destination")
+        else:
+            process_location_request(address, city, province, current_action, destination)
+    else:
+        # Drop a pending request once the user changes its inputs
+        cancel_stale_location_request(address, city, province, current_action, destination)
+    
+    # Results fill in as the background geocode and route calls finish
+    show_location_result(data)
     
     # Help section
     st.sidebar.markdown("---")
@@ -438,7 +472,7 @@ def create_find_ride_section(data):
         st.markdown('<div style="margin-top: 2rem;">', unsafe_allow_html=True)
         if st.button(action_text, key="journey_btn", use_container_width=True):
             if address.strip():
-                process_location_request(address, city, province, st.session_state.get('action', 'rent'), data)
+                process_location_request(address, city, province, st.session_state.get('action', 'rent'))
             else:
                 st.error("⚠️ Please enter your street address")
         st.markdown('</div>', unsafe_allow_html=True)
@@ -466,7 +500,7 @@ def create_find_ride_section(data):
         </div>
         ''', unsafe_allow_html=True)
 
-def create_map_section(data):
+def create_map_section(data, metrics):
     """Create the map section"""
     st.markdown('<h2 class="section-title"><span style="color: #922b0d;">EXPLORE</span> THE NETWORK</h2>', unsafe_allow_html=True)
     
@@ -476,25 +510,22 @@ def create_map_section(data):
     center = [43.65306613746548, -79.38815311015]
     m = folium.Map(location=center, zoom_start=12, tiles='cartodbpositron')
     
-    # Add station markers
-    for _, row in data.iterrows():
-        marker_color = get_marker_color(row['num_bikes_available'])
-        folium.CircleMarker(
-            location=[row['lat'], row['lon']],
-            radius=3,
-            color=marker_color,
-            fill=True,
-            fill_color=marker_color,
-            fill_opacity=0.7,
-            popup=folium.Popup(
-                f"<b>Station:</b> {row.get('name', row['station_id'])}<br>"
-                f"<b>Total Bikes:</b> {row['num_bikes_available']}<br>"
-                f"<b>E-bikes:</b> {row['ebike']}<br>"
-                f"<b>Mechanical:</b> {row['mechanical']}<br>"
-                f"<b>Docks:</b> {row['num_docks_available']}", 
-                max_width=300
-            )
-        ).add_to(m)
+    # Static station layer, cached per station_information snapshot, plus a small
+    # availability layer that st_folium patches in without reloading the map
+    popup = folium.GeoJsonPopup(
+        fields=['name', 'num_bikes_available', 'ebike', 'mechanical', 'num_docks_available'],
+        aliases=['Station:', 'Total Bikes:', 'E-bikes:', 'Mechanical:', 'Docks:'],
+        max_width=300
+    )
+    geometry = get_station_geometry(STATION_INFO_URL)
+    if geometry is not None:
+        station_base_layer(geometry, radius=3, popup=popup).add_to(m)
+        # Clusters when zoomed out, stations when zoomed in
+        zoom = (st.session_state.get('network_map') or {}).get('zoom') or 12
+        availability = station_availability_layer(data, radius=3, fill_opacity=0.7, zoom=zoom)
+    else:
+        station_layer(data, radius=3, fill_opacity=0.7, popup=popup).add_to(m)
+        availability = None
     
     # Create styled map container with border - properly centered
     st.markdown('''
@@ -530,15 +561,15 @@ def create_map_section(data):
     ''', unsafe_allow_html=True)
     
     # Display larger centered map with proper width
-    st_folium(m, width=900, height=600, returned_objects=[], use_container_width=True)
+    st_folium(m, key='network_map', width=900, height=600, returned_objects=['zoom'], use_container_width=True, feature_group_to_add=availability)
     
     # Close the styled container
     st.markdown('</div></div></div>', unsafe_allow_html=True)
     
     # Map legend
-    ready_stations = len(data[data['num_bikes_available'] >= 5])
-    limited_stations = len(data[(data['num_bikes_available'] >= 1) & (data['num_bikes_available'] < 5)])
-    empty_stations = len(data[data['num_bikes_available'] == 0])
+    ready_stations = metrics['ready_stations']
+    limited_stations = metrics['limited_stations']
+    empty_stations = metrics['empty_stations']
     
     st.markdown("---")
     
@@ -572,57 +603,163 @@ def create_footer():
     </div>
     ''', unsafe_allow_html=True)
 
-def process_location_request(address, city, province, action, data):
-    """Process location request and show results"""
-    full_address = f"{address} {city} {province}"
+def location_request_mode(action):
+    """Availability mode for a rent, return or trip request"""
+    if action in ("rent", "trip"):
+        # Selected bike type from session state ('any', 'ebike' or 'mechanical')
+        return st.session_state.get('bike_type', 'any')
+    return 'dock'
+
+def location_request_inputs(address, city, province, action, destination=""):
+    """The inputs a location request is started from, to tell when they change"""
+    full_destination = f"{destination} {city} {province}" if action == 'trip' else None
+    return (f"{address} {city} {province}", location_request_mode(action), action, full_destination)
+
+def process_location_request(address, city, province, action, destination=""):
+    """Start a location request; geocoding and routing run in the background"""
+    inputs = location_request_inputs(address, city, province, action, destination)
+    full_address, mode, _, full_destination = inputs
     
-    with st.spinner(f"🔍 Finding your {'bike' if action == 'rent' else 'dock'}..."):
-        try:
-            user_location = geocode(full_address)
-            if not user_location:
-                st.error("❌ Could not find the address. Please check and try again.")
-                return
-            
-            if action == "rent":
-                # Get selected bike type from session state
-                bike_type = st.session_state.get('bike_type', 'any')
-                if bike_type == 'ebike':
-                    chosen_station = get_bike_availability(user_location, data, ["ebike"])
-                elif bike_type == 'mechanical':
-                    chosen_station = get_bike_availability(user_location, data, ["mechanical"])
-                else:  # any
-                    chosen_station = get_bike_availability(user_location, data, ["mechanical", "ebike"])
-            else:
-                chosen_station = get_dock_availability(user_location, data)
-            
-            if chosen_station:
-                display_route_result(user_location, chosen_station, data, action)
-            else:
-                bike_type_text = st.session_state.get('bike_type', 'mechanical')
-                if action == 'rent':
-                    st.warning(f"⚠️ No {bike_type_text} {'bikes' if action == 'rent' else 'docks'} available nearby. Try selecting a different bike type.")
-                else:
-                    st.warning(f"⚠️ No {'bikes' if action == 'rent' else 'docks'} available nearby.")
-                
-        except Exception as e:
-            st.error(f"❌ Error: {str(e)}")
+    previous = st.session_state.get('journey')
+    if previous is not None:
+        cancel_journey(previous)
+    
+    if action == 'trip':
+        journey = start_trip(full_address, full_destination, mode)
+    else:
+        journey = start_journey(full_address, mode)
+    journey['action'] = action
+    journey['inputs'] = inputs
+    st.session_state.journey = journey
 
-def display_route_result(user_location, chosen_station, data, action):
-    """Display route result with map"""
+def cancel_stale_location_request(address, city, province, action, destination=""):
+    """Cancel the current location request if its inputs have changed"""
+    journey = st.session_state.get('journey')
+    if journey is None:
+        return
+    
+    if journey['inputs'] != location_request_inputs(address, city, province, action, destination):
+        cancel_journey(journey)
+        del st.session_state['journey']
+
+def show_location_result(data):
+    """Show the current location request, polling it while jobs are pending"""
+    journey = st.session_state.get('journey')
+    if journey is None:
+        return
+    
+    # A request that failed while rendering only shows why
+    if journey['error'] is not None and journey['error'] not in JOURNEY_ERRORS:
+        st.error(f"❌ Error: {journey['error']}")
+        return
+    
+    # Only this section reruns while waiting on the background jobs
+    pending = trip_pending(journey) if journey['action'] == 'trip' else journey_pending(journey)
+    journey['interval'] = JOURNEY_POLL_SECONDS if pending else None
+    st.fragment(render_location_result, run_every=journey['interval'])(data)
+
+def render_location_result(data):
+    """Render the location request as far as it has got"""
+    journey = st.session_state.get('journey')
+    if journey is None:
+        return
+    
+    action = journey['action']
+    try:
+        # Spatial index for the current station_information snapshot
+        index = get_station_index(STATION_INFO_URL)
+        if action == 'trip':
+            pending = poll_trip(journey, data, index, wait=JOURNEY_POLL_SECONDS)
+            display_trip_status(journey, data, index)
+        else:
+            pending = poll_journey(journey, data, index, wait=JOURNEY_POLL_SECONDS)
+            display_journey_status(journey, data, index)
+    except Exception as e:
+        # Record the failure so the rerun below shows it instead of polling again
+        fail_journey(journey, str(e))
+        st.error(f"❌ Error: {journey['error']}")
+        pending = False
+    
+    # Finished: rerun the app once so this section stops polling
+    if not pending and journey.get('interval') is not None:
+        st.rerun()
+
+def display_journey_status(journey, data, index):
+    """Display a rent or return request as far as it has got"""
+    action = journey['action']
+    if journey['error'] == 'address':
+        st.error("❌ Could not find the address. Please check and try again.")
+    elif journey['error'] == 'stations':
+        st.error("❌ Could not search nearby stations. Please try again.")
+    elif journey['candidates'] is None:
+        st.info(f"🔍 Finding your {'bike' if action == 'rent' else 'dock'}...")
+    elif journey['candidates']:
+        best = journey['candidates'][0]
+        chosen_station = [best['station_id'], best['lat'], best['lon']]
+        display_route_result(journey['location'], chosen_station, data, action, index, journey['route'])
+        display_station_options(journey['candidates'], data, action)
+    else:
+        bike_type_text = st.session_state.get('bike_type', 'mechanical')
+        if action == 'rent':
+            st.warning(f"⚠️ No {bike_type_text} {'bikes' if action == 'rent' else 'docks'} available nearby. Try selecting a different bike type.")
+        else:
+            st.warning(f"⚠️ No {'bikes' if action == 'rent' else 'docks'} available nearby.")
+
+def display_trip_status(trip, data, index):
+    """Display a trip request as far as it has got"""
+    if trip['error'] == 'origin':
+        st.error("❌ Could not find your starting address. Please check and try again.")
+    elif trip['error'] == 'destination':
+        st.error("❌ Could not find your destination. Please check and try again.")
+    elif trip['error'] == 'stations':
+        st.error("❌ Could not plan the trip. Please try again.")
+    elif trip['plan'] is None:
+        st.info("🔍 Planning your trip...")
+    elif trip['plan']:
+        display_trip_result(trip, data, index)
+    else:
+        st.warning("⚠️ No bikes near your start or no docks near your destination right now.")
+
+def display_station_options(candidates, data, action):
+    """Display the ranked station options"""
+    st.markdown("**🧭 Your best options**")
+    
+    # A candidate can drop out of a later snapshot while the result is still shown
+    rows = data[data['station_id'].isin([c['station_id'] for c in candidates])].set_index('station_id')
+    
+    for rank, candidate in enumerate(candidates, start=1):
+        if candidate['station_id'] not in rows.index:
+            st.markdown(f"{rank}. ~~Station {candidate['station_id']}~~ • ⚠️ No longer reported")
+            continue
+        
+        row = rows.loc[candidate['station_id']]
+        walk_time = format_duration(candidate['walk_seconds'])
+        
+        if action == 'rent':
+            stock = f"🚲 {row['num_bikes_available']} bikes ({row['ebike']} e-bikes)"
+        else:
+            stock = f"🔒 {row['num_docks_available']} docks"
+        
+        if candidate.get('probability') is not None:
+            stock += f" • {candidate['probability']:.0%} likely on arrival"
+        
+        st.markdown(f"{rank}. **{row.get('name', candidate['station_id'])}** • 🚶 {walk_time} ({candidate['distance_km']:.2f} km) • {stock}")
+
+def display_route_result(user_location, chosen_station, data, action, index=None, route=None):
+    """Display route result with map; route is None while it is still being computed"""
     m = folium.Map(location=user_location, zoom_start=16, tiles='cartodbpositron')
     
-    # Add all stations
-    for _, row in data.iterrows():
-        marker_color = get_marker_color(row['num_bikes_available'])
-        folium.CircleMarker(
-            location=[row['lat'], row['lon']],
-            radius=4,
-            color=marker_color,
-            fill=True,
-            fill_color=marker_color,
-            fill_opacity=0.8,
-            popup=f"Bikes: {row['num_bikes_available']}<br>E-bikes: {row['ebike']}<br>Mechanical: {row['mechanical']}<br>Docks: {row['num_docks_available']}"
-        ).add_to(m)
+    # Add the stations around the route
+    nearby = stations_near_route(user_location, [chosen_station[1], chosen_station[2]], data, index)
+    station_layer(
+        nearby,
+        radius=4,
+        fill_opacity=0.8,
+        popup=folium.GeoJsonPopup(
+            fields=['num_bikes_available', 'ebike', 'mechanical', 'num_docks_available'],
+            aliases=['Bikes:', 'E-bikes:', 'Mechanical:', 'Docks:']
+        )
+    ).add_to(m)
     
     # Add user and chosen station
     folium.Marker(user_location, popup="📍 You are here", icon=folium.Icon(color="blue")).add_to(m)
@@ -632,16 +769,75 @@ def display_route_result(user_location, chosen_station, data, action):
         icon=folium.Icon(color="red")
     ).add_to(m)
     
-    # Add route
-    try:
-        coordinates, duration = run_osrm(chosen_station, user_location)
-        folium.PolyLine(coordinates, color="blue", weight=4, opacity=0.8).add_to(m)
-    except:
-        duration = "N/A"
+    # Add route, a straight line until the walking route is ready or if it failed
+    if route:
+        coordinates, duration = route['coordinates'], format_duration(route['duration'])
+    else:
+        coordinates = [user_location, [chosen_station[1], chosen_station[2]]]
+        duration = "calculating..." if route is None else "N/A"
+    folium.PolyLine(coordinates, color="blue", weight=4, opacity=0.8, dash_array=None if route else "5,10").add_to(m)
     
     st.success(f"✅ Found! Walking time: **{duration}**")
     st_folium(m, width=700, height=400, returned_objects=[])
 
+def display_trip_result(trip, data, index=None):
+    """Display a trip plan with map; each leg is a straight line until its route is ready"""
+    plan, routes = trip['plan'], trip['routes'] or {}
+    pickup = [plan['pickup']['lat'], plan['pickup']['lon']]
+    dropoff = [plan['dropoff']['lat'], plan['dropoff']['lon']]
+    
+    m = folium.Map(location=trip['origin'], zoom_start=14, tiles='cartodbpositron')
+    m.fit_bounds([trip['origin'], trip['destination'], pickup, dropoff])
+    
+    # Add the stations around both ends of the trip
+    nearby = pd.concat([
+        stations_near_route(trip['origin'], pickup, data, index),
+        stations_near_route(dropoff, trip['destination'], data, index)
+    ]).drop_duplicates(subset='station_id')
+    station_layer(
+        nearby,
+        radius=4,
+        fill_opacity=0.8,
+        popup=folium.GeoJsonPopup(
+            fields=['num_bikes_available', 'ebike', 'mechanical', 'num_docks_available'],
+            aliases=['Bikes:', 'E-bikes:', 'Mechanical:', 'Docks:']
+        )
+    ).add_to(m)
+    
+    # Add both ends and the two stations
+    folium.Marker(trip['origin'], popup="📍 Start", icon=folium.Icon(color="blue")).add_to(m)
+    folium.Marker(pickup, popup="🚲 Get bike here", icon=folium.Icon(color="red")).add_to(m)
+    folium.Marker(dropoff, popup="🔒 Return bike here", icon=folium.Icon(color="green")).add_to(m)
+    folium.Marker(trip['destination'], popup="🏁 Destination", icon=folium.Icon(color="darkblue")).add_to(m)
+    
+    # Walk, ride, walk; straight lines until the routes are ready or if they failed
+    for leg, start, end, color in (
+        ('walk_to', trip['origin'], pickup, "blue"),
+        ('ride', pickup, dropoff, "#922b0d"),
+        ('walk_from', dropoff, trip['destination'], "blue")
+    ):
+        route = routes.get(leg)
+        coordinates = route['coordinates'] if route else [start, end]
+        folium.PolyLine(coordinates, color=color, weight=4, opacity=0.8, dash_array=None if route else "5,10").add_to(m)
+    
+    # Either station may have dropped out of a newer snapshot since the plan was made
+    names = data.set_index('station_id')['name']
+    pickup_name = names.get(plan['pickup']['station_id'])
+    dropoff_name = names.get(plan['dropoff']['station_id'])
+    if pickup_name is None or dropoff_name is None:
+        st.warning("⚠️ A station on this trip is no longer reported. Plan the trip again for a fresh route.")
+    pickup_name = pickup_name if pickup_name is not None else f"Station {plan['pickup']['station_id']}"
+    dropoff_name = dropoff_name if dropoff_name is not None else f"Station {plan['dropoff']['station_id']}"
+    st.success(f"✅ Trip planned! About **{format_duration(plan['total_seconds'])}** door to door")
+    st.markdown(
+        f"🚶 {format_duration(plan['walk_to_seconds'])} to **{pickup_name}** • "
+        f"🚲 {format_duration(plan['ride_seconds'])} ride to **{dropoff_name}** • "
+        f"🚶 {format_duration(plan['walk_from_seconds'])} to your destination"
+    )
+    if plan['probability'] is not None:
+        st.caption(f"{plan['probability']:.0%} likely a bike and a dock are there when you arrive")
+    st_folium(m, width=700, height=400, returned_objects=[])
+
 if __name__ == "__main__":
     main()
 
@@ -4,349 +4,3789 @@ Contains utility functions for data fetching, processing, and mapping
 """
 
 import requests
+import numpy as np
 import pandas as pd
 import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import heapq
+import tracemalloc
+import folium
+from branca.element import MacroElement
+from folium.template import Template
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from geopy.adapters import BaseSyncAdapter, RequestsAdapter
 from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
 import streamlit as st
 
+# orjson parses the GBFS feeds several times faster when it is installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# File locks elect one feed fetcher per host; without them (Windows) every
+# process keeps fetching for itself
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Local state (snapshots, caches) lives next to the app
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+# Shared HTTP client settings for every outbound call in this module
+HTTP_POOL_SIZE = 10
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_BACKOFF_JITTER = 0.5
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_circuits = {}
+_circuits_lock = threading.Lock()
+_geolocator = None
+
+# Geocoding: in-memory LRU, persistent SQLite cache and optional local gazetteer
+# (CSV with name,lat,lon rows: intersections, landmarks, postal code centroids)
+GEOCODE_CACHE_PATH = os.path.join(CACHE_DIR, 'geocode.sqlite')
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.csv')
+GEOCODE_LRU_SIZE = 512
+NOMINATIM_MIN_INTERVAL = 1.0
+
+_geocode_lru = OrderedDict()
+_geocode_lock = threading.Lock()
+_geocode_connections = threading.local()
+_geocode_schemas = set()
+_gazetteer = None
+_gazetteer_sources = None
+_nominatim_lock = threading.Lock()
+_nominatim_last_call = 0.0
+
+# Routing: backends tried in order, results cached by snapped origin/destination cells
+OSRM_BASE_URL = os.environ.get('OSRM_BASE_URL', "http://router.project-osrm.org")
+STREET_GRAPH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'street_graph.json')
+ROUTING_BACKENDS = ['osrm', 'graph']
+ROUTE_CACHE_CELL_M = 50
+ROUTE_CACHE_SIZE = 1024
+TRAVEL_SPEED_MPS = {'walking': 1.4, 'cycling': 4.5}
+
+_route_cache = OrderedDict()
+_route_cache_lock = threading.Lock()
+_street_graph = None
+_street_graph_lock = threading.Lock()
+
+# Route maps only draw stations this far beyond the route's endpoints
+ROUTE_MAP_MARGIN_KM = 0.5
+
+# Compact column types for the station frames; station ids are categorical so
+# each id string is stored once, counts fit in uint16 and flags are booleans
+STATUS_SCHEMA = {
+    'station_id': 'category',
+    'num_bikes_available': 'uint16',
+    'num_docks_available': 'uint16',
+    'is_installed': 'bool',
+    'is_renting': 'bool',
+    'is_returning': 'bool',
+    'last_reported': 'int64',
+    'ebike': 'uint16',
+    'mechanical': 'uint16'
+}
+INFORMATION_SCHEMA = {
+    'station_id': 'category',
+    'name': 'string',
+    'lat': 'float32',
+    'lon': 'float32',
+    'capacity': 'uint16'
+}
+JOINED_SCHEMA = {**STATUS_SCHEMA, **INFORMATION_SCHEMA}
+
+# Mean Earth radius used by the vectorized distance kernel
+EARTH_RADIUS_KM = 6371.0088
+
+# Closest haversine candidates re-ranked with the exact geodesic distance
+GEODESIC_RERANK_K = 5
+
+# Grid bucket size of the station spatial index
+STATION_INDEX_CELL_KM = 0.5
+KM_PER_DEGREE_LAT = 111.195
+
+_station_indexes = {}
+
+# Shortest time a cached feed is reused, even when the feed advertises ttl=0
+FEED_MIN_TTL = 5
+
+# Process-wide GBFS feed cache keyed by URL, shared by every Streamlit session
+_feed_cache = {}
+_feed_cache_lock = threading.Lock()
+_feed_url_locks = {}
+
+# On-disk station_information snapshot, revalidated with ETag/Last-Modified
+STATION_INFO_SNAPSHOT_PATH = os.path.join(CACHE_DIR, 'station_information.json')
+STATION_INFO_TTL = 6 * 60 * 60
+
+_station_info = {}
+_station_info_lock = threading.Lock()
+_station_info_frames = {}
+
+# Small shared pool for outbound requests that run side by side (both GBFS
+# feeds, the routing matrices of a trip plan)
+_fetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gbfs-fetch")
+
+# Static station geometry for the map base layer, one per station_information snapshot
+_station_geometries = {}
+
+# Below this zoom the network map shows grid clusters sized to about
+# STATION_CLUSTER_CELL_PX screen pixels instead of individual stations
+STATION_CLUSTER_MAX_ZOOM = 14
+STATION_CLUSTER_CELL_PX = 60
+WEB_MERCATOR_M_PER_PX = 156543.03392
+
+# Background jobs for the journey flow; slow geocoding and routing calls run on a
+# shared pool with a deadline each, so a script run never blocks on them
+JOB_WORKERS = 8
+GEOCODE_DEADLINE = 10.0
+STATIONS_DEADLINE = 10.0
+ROUTE_DEADLINE = 15.0
+JOURNEY_POLL_SECONDS = 0.5
+# Errors poll_journey and poll_trip record; any other error is the message of a
+# request that failed while being rendered (see fail_journey)
+JOURNEY_ERRORS = ('address', 'stations', 'origin', 'destination')
+
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="journey-job")
+# Geocoding has its own single worker: Nominatim allows one request a second, so
+# queued lookups wait here instead of holding pool workers the station and
+# route jobs need
+_geocode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="geocode-job")
+
+# Trip planner: TRIP_CANDIDATES pickup stations around the origin and docks
+# around the destination, one bounded cycling matrix between them, and plans
+# cached briefly per pair of TRIP_CACHE_CELL_M cells
+TRIP_CANDIDATES = 4
+TRIP_CACHE_CELL_M = 150
+TRIP_CACHE_TTL = 60
+TRIP_CACHE_SIZE = 256
+TRIP_DEADLINE = 15.0
+
+_trip_cache = OrderedDict()
+_trip_cache_lock = threading.Lock()
+
+# Station history: status rows whose last_reported changed are appended to a
+# per-day log and compacted into a sorted .npy partition once the day is over.
+# Recording is opt-in; with the Toronto feed it takes about 18 MB per day
+HISTORY_DIR = os.path.join(CACHE_DIR, 'history')
+HISTORY_ENABLED = os.environ.get('BIKESHARE_HISTORY', '0') == '1'
+
+def _history_retention_days(default=90):
+    """Days of history to keep from BIKESHARE_HISTORY_DAYS, at least one"""
+    value = os.environ.get('BIKESHARE_HISTORY_DAYS', str(default))
+    try:
+        days = int(value)
+    except ValueError:
+        logger.warning("Ignoring BIKESHARE_HISTORY_DAYS=%r, keeping %d days of history", value, default)
+        return default
+    return max(days, 1)
+
+HISTORY_RETENTION_DAYS = _history_retention_days()
+HISTORY_MAINTENANCE_INTERVAL = 3600
+HISTORY_DTYPE = np.dtype([
+    ('station', '<u4'),
+    ('last_reported', '<i8'),
+    ('num_bikes_available', '<u2'),
+    ('num_docks_available', '<u2'),
+    ('ebike', '<u2'),
+    ('mechanical', '<u2'),
+    ('flags', 'u1')
+])
+# Compaction, retention and forecast training run on their own thread so they
+# never hold up a poll
+_history_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-maintenance")
+
+HISTORY_COUNTS = ['num_bikes_available', 'num_docks_available', 'ebike', 'mechanical']
+HISTORY_FLAGS = ['is_installed', 'is_renting', 'is_returning']
+SECONDS_PER_DAY = 86400
+
+# Availability forecasts: per-station hour-of-week baselines trained from the
+# recorded history, plus a short-horizon trend tracked from the live snapshots.
+# A station's deviation from its baseline fades over FORECAST_DECAY_MINUTES.
+FORECAST_PATH = os.path.join(CACHE_DIR, 'forecast.npz')
+FORECAST_TRAINING_DAYS = 28
+FORECAST_TIMEZONE = 'America/Toronto'
+FORECAST_MAX_HOLD = 1800
+FORECAST_PRIOR_SECONDS = 3600
+FORECAST_DECAY_MINUTES = 45.0
+FORECAST_TREND_MINUTES = 20.0
+HOURS_PER_WEEK = 168
+
+# Count a journey mode needs at the station it picks
+MODE_COUNTS = {
+    'any': 'num_bikes_available',
+    'ebike': 'ebike',
+    'mechanical': 'mechanical',
+    'dock': 'num_docks_available'
+}
+
+# Station choice: the closest STATION_SCORE_POOL stations are scored by walking
+# time plus the expected cost of finding one empty (a detour to the next one).
+# The local part of the ranking (index lookup, forecast, scoring) gets
+# STATION_SCORE_BUDGET seconds; past it stations are ranked by walking time alone
+STATION_SCORE_POOL = 8
+STATION_SCORE_BUDGET = 0.05
+MISSED_STATION_PENALTY = 300.0
+FORECAST_MIN_SPREAD = 0.5
+
+_forecast = {'model': None, 'mtime': None, 'state': None}
+
+# Shared snapshots: the fetcher process writes each snapshot as a memory-mapped
+# structured array and swaps a generation pointer; other processes on the host
+# map it instead of fetching themselves
+SHARED_SNAPSHOT_DIR = os.path.join(CACHE_DIR, 'snapshots')
+SHARED_SNAPSHOTS = os.environ.get('BIKESHARE_SHARED_SNAPSHOTS', '1') != '0'
+SHARED_SNAPSHOT_KEEP = 3
+SHARED_SNAPSHOT_POLL = 1.0
+
+_fetcher_lock_file = None
+_shared_snapshot = {'generation': None, 'snapshot': None}
+
+# Latest joined station snapshot published by the background feed poller
+POLLER_MAX_BACKOFF = 60
+
+_latest_snapshot = None
+_snapshot_ready = threading.Condition()
+_poller_thread = None
+_poller_stop = threading.Event()
+
+class CircuitOpenError(requests.RequestException):
+    """Raised when calls to a host are short-circuited after repeated failures"""
+
+def _build_http_session():
+    """
+    Create the pooled, retrying requests session shared by all outbound calls
+    
+    Returns:
+        requests.Session: Session with keep-alive pools and retry/backoff
+    """
+    retry_options = dict(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    try:
+        retry = Retry(backoff_jitter=HTTP_BACKOFF_JITTER, **retry_options)
+    except TypeError:
+        # urllib3 < 2.0 has no jitter support
+        retry = Retry(**retry_options)
+    
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = "toronto_bikeshare_app"
+    return session
+
+def get_http_session():
+    """
+    Get the process-wide pooled HTTP session
+    
+    Returns:
+        requests.Session: Shared session
+    """
+    global _http_session
+    
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                _http_session = _build_http_session()
+    return _http_session
+
+def _circuit_check(host):
+    """
+    Fail fast if the circuit for a host is open
+    
+    After CIRCUIT_RESET_TIMEOUT one trial call is let through (half-open);
+    its outcome decides whether the circuit closes again.
+    
+    Args:
+        host (str): Host name the call is going to
+    """
+    with _circuits_lock:
+        circuit = _circuits.get(host)
+        if not circuit or circuit['opened_at'] is None:
+            return
+        
+        if time.time() - circuit['opened_at'] < CIRCUIT_RESET_TIMEOUT or circuit['trial']:
+            raise CircuitOpenError(f"{host} is unavailable, retrying shortly")
+        circuit['trial'] = True
+
+def _circuit_record(host, success):
+    """
+    Record the outcome of a call for the host's circuit breaker
+    
+    Args:
+        host (str): Host name the call went to
+        success (bool): Whether the call succeeded
+    """
+    with _circuits_lock:
+        circuit = _circuits.setdefault(host, {'failures': 0, 'opened_at': None, 'trial': False})
+        circuit['trial'] = False
+        
+        if success:
+            circuit['failures'] = 0
+            circuit['opened_at'] = None
+            return
+        
+        circuit['failures'] += 1
+        if circuit['failures'] >= CIRCUIT_FAILURE_THRESHOLD or circuit['opened_at'] is not None:
+            circuit['opened_at'] = time.time()
+
+def http_get(url, **kwargs):
+    """
+    GET a URL through the shared session and the host's circuit breaker
+    
+    Args:
+        url (str): URL to fetch
+        **kwargs: Extra arguments for requests.Session.get (timeout, headers...)
+        
+    Returns:
+        requests.Response: The response (5xx responses count as failures)
+    """
+    host = urlsplit(url).netloc
+    _circuit_check(host)
+    
+    kwargs.setdefault('timeout', 10)
+    success = False
+    try:
+        response = get_http_session().get(url, **kwargs)
+        success = response.status_code < 500
+    finally:
+        # Always settle the call, or a half-open trial would stay taken forever
+        _circuit_record(host, success)
+    return response
+
+class _SharedSessionAdapter(RequestsAdapter):
+    """geopy adapter that sends requests through the shared pooled session"""
+    
+    def __init__(self, *, proxies, ssl_context):
+        BaseSyncAdapter.__init__(self, proxies=proxies, ssl_context=ssl_context)
+        self.session = get_http_session()
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # The session is shared with the feed and routing calls, leave it open
+        pass
+    
+    def __del__(self):
+        pass
+
+def get_geolocator():
+    """
+    Get the shared Nominatim geocoder (one client keeps its connection pool)
+    
+    Returns:
+        geopy.geocoders.Nominatim: Shared geocoder
+    """
+    global _geolocator
+    
+    if _geolocator is None:
+        _geolocator = Nominatim(
+            user_agent="toronto_bikeshare_app",
+            timeout=10,
+            adapter_factory=_SharedSessionAdapter
+        )
+    return _geolocator
+
+def _feed_expiry(payload, fetched_at):
+    """
+    Work out when a fetched GBFS payload should be refreshed
+    
+    Args:
+        payload (dict): Parsed GBFS feed with 'last_updated' and 'ttl' fields
+        fetched_at (float): Local time the payload was received
+        
+    Returns:
+        float: Local timestamp after which the payload is stale
+    """
+    ttl = payload.get('ttl', 0) or 0
+    last_updated = payload.get('last_updated', fetched_at) or fetched_at
+    
+    # Time already spent on the server counts against the TTL, but clock skew
+    # must never push the expiry past a full TTL from now
+    age = min(max(0, fetched_at - last_updated), ttl)
+    return fetched_at + max(ttl - age, FEED_MIN_TTL)
+
+def fetch_gbfs_feed(url, timeout=10):
+    """
+    Fetch a GBFS feed through the process-wide cache
+    
+    The cached payload is shared by all sessions and only re-downloaded once
+    the feed's own 'ttl' (counted from 'last_updated') has run out, so
+    concurrent reruns cost at most one request per feed per TTL window.
+    
+    Args:
+        url (str): GBFS feed URL
+        timeout (float): Request timeout in seconds
+        
+    Returns:
+        dict: Parsed feed payload (shared, treat as read-only)
+    """
+    entry = _feed_cache.get(url)
+    if entry and time.time() < entry['expires_at']:
+        return entry['payload']
+    
+    with _feed_cache_lock:
+        url_lock = _feed_url_locks.setdefault(url, threading.Lock())
+    
+    # Only one thread refreshes a given feed; the rest wait and reuse its result
+    with url_lock:
+        entry = _feed_cache.get(url)
+        if entry and time.time() < entry['expires_at']:
+            return entry['payload']
+        
+        response = http_get(url, timeout=timeout)
+        response.raise_for_status()
+        payload = _json_loads(response.content)
+        
+        fetched_at = time.time()
+        _feed_cache[url] = {
+            'payload': payload,
+            'fetched_at': fetched_at,
+            'expires_at': _feed_expiry(payload, fetched_at)
+        }
+        return payload
+
+def _read_station_info_snapshot(path):
+    """
+    Load the last saved station_information snapshot from disk
+    
+    Args:
+        path (str): Snapshot file path
+        
+    Returns:
+        dict or None: Snapshot with payload and validators, None if unavailable
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if not isinstance(snapshot['payload']['data']['stations'], list):
+            return None
+        return snapshot
+    except (OSError, KeyError, TypeError, json.JSONDecodeError):
+        return None
+
+def _write_station_info_snapshot(path, snapshot):
+    """
+    Atomically save a station_information snapshot to disk
+    
+    Args:
+        path (str): Snapshot file path
+        snapshot (dict): Snapshot with payload and validators
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # A read-only disk only costs us the offline cold start
+        pass
+
+def load_station_information(url, path=STATION_INFO_SNAPSHOT_PATH, timeout=10):
+    """
+    Get the station_information payload from the persisted snapshot
+    
+    The snapshot is loaded from disk on first use and only revalidated against
+    the API (If-None-Match / If-Modified-Since) once STATION_INFO_TTL has
+    passed. If the API cannot be reached the last good snapshot is served.
+    
+    Args:
+        url (str): API endpoint URL for station information
+        path (str): Snapshot file path
+        timeout (float): Revalidation request timeout in seconds
+        
+    Returns:
+        dict: Parsed station_information payload (shared, treat as read-only)
+    """
+    with _station_info_lock:
+        snapshot = _station_info.get(url)
+        if snapshot is None:
+            snapshot = _read_station_info_snapshot(path)
+            if snapshot is not None and snapshot.get('url') != url:
+                snapshot = None
+            if snapshot is not None:
+                _station_info[url] = snapshot
+        
+        if snapshot and time.time() - snapshot['checked_at'] < STATION_INFO_TTL:
+            return snapshot['payload']
+        
+        headers = {}
+        if snapshot:
+            if snapshot.get('etag'):
+                headers['If-None-Match'] = snapshot['etag']
+            if snapshot.get('last_modified'):
+                headers['If-Modified-Since'] = snapshot['last_modified']
+        
+        try:
+            response = http_get(url, headers=headers, timeout=timeout)
+            if response.status_code == 304 and snapshot:
+                snapshot['checked_at'] = time.time()
+                _write_station_info_snapshot(path, snapshot)
+                return snapshot['payload']
+            
+            response.raise_for_status()
+            payload = response.json()
+            if not isinstance(payload['data']['stations'], list):
+                raise ValueError("station_information has no station list")
+        except (requests.RequestException, KeyError, TypeError, ValueError):
+            if snapshot:
+                return snapshot['payload']
+            raise
+        
+        snapshot = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'checked_at': time.time(),
+            'payload': payload
+        }
+        _station_info[url] = snapshot
+        _write_station_info_snapshot(path, snapshot)
+        return payload
+
+def apply_schema(df, schema):
+    """
+    Cast a station frame to its compact column types
+    
+    Args:
+        df (pandas.DataFrame): Station frame
+        schema (dict): Column name -> dtype (STATUS_SCHEMA, INFORMATION_SCHEMA
+            or JOINED_SCHEMA); columns the frame doesn't have are skipped
+        
+    Returns:
+        pandas.DataFrame: Frame with the schema's dtypes
+    """
+    dtypes = {
+        column: dtype for column, dtype in schema.items()
+        if column in df.columns and str(df[column].dtype) != dtype
+    }
+    return df.astype(dtypes) if dtypes else df
+
+def memory_report(df):
+    """
+    Per-column memory use of a station frame against default pandas dtypes
+    
+    Args:
+        df (pandas.DataFrame): Station frame
+        
+    Returns:
+        pandas.DataFrame: 'dtype', 'bytes' and 'default_bytes' (int64/float64/
+            object equivalent) per column, plus a 'total' row
+    """
+    rows = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+            default = series.astype('int64')
+        elif pd.api.types.is_float_dtype(series):
+            default = series.astype('float64')
+        else:
+            default = series.astype(object)
+        
+        rows[column] = {
+            'dtype': str(series.dtype),
+            'bytes': int(series.memory_usage(index=False, deep=True)),
+            'default_bytes': int(default.memory_usage(index=False, deep=True))
+        }
+    
+    report = pd.DataFrame.from_dict(rows, orient='index', columns=['dtype', 'bytes', 'default_bytes'])
+    report.loc['total'] = ['', report['bytes'].sum(), report['default_bytes'].sum()]
+    return report
+
+def _vehicle_type_counts(station):
+    """
+    E-bike and mechanical counts for one station, whatever the feed format
+    
+    Args:
+        station (dict): Station entry from station_status
+        
+    Returns:
+        tuple: (ebike_count, mechanical_count)
+    """
+    if 'num_bikes_available_types' in station:
+        bike_types = station['num_bikes_available_types']
+        if isinstance(bike_types, dict):
+            return bike_types.get('ebike', 0), bike_types.get('mechanical', 0)
+        return 0, station.get('num_bikes_available')
+    
+    if 'vehicle_types_available' in station:
+        # Fallback for older API format
+        ebike_count = 0
+        mechanical_count = 0
+        for vehicle_type in station['vehicle_types_available']:
+            if vehicle_type['vehicle_type_id'] == 'ebike':
+                ebike_count = vehicle_type['count']
+            elif vehicle_type['vehicle_type_id'] == 'mechanical':
+                mechanical_count = vehicle_type['count']
+        return ebike_count, mechanical_count
+    
+    # Fallback if no vehicle type data available
+    return 0, station.get('num_bikes_available')
+
+def _count_column(values):
+    """
+    Convert feed counts to a uint16 column, coercing bad entries to 0
+    
+    Args:
+        values (list): Counts as they appear in the feed
+        
+    Returns:
+        numpy.ndarray: uint16 counts (null, missing, non-numeric or out of range become 0)
+    """
+    try:
+        return np.fromiter(values, dtype=np.uint16, count=len(values))
+    except (TypeError, ValueError, OverflowError):
+        counts = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+        counts = counts.where((counts >= 0) & (counts <= np.iinfo(np.uint16).max))
+        return counts.fillna(0).to_numpy(dtype=np.uint16)
+
+def parse_station_status(payload):
+    """
+    Convert a station_status payload into a DataFrame
+    
+    Columns are pulled straight out of the station list into typed NumPy
+    arrays (see STATUS_SCHEMA) instead of building a dict per station.
+    
+    Args:
+        payload (dict): Parsed station_status feed
+        
+    Returns:
+        pandas.DataFrame: DataFrame containing station status information
+    """
+    stations = payload['data']['stations']
+    count = len(stations)
+    
+    def column(field, dtype):
+        return np.fromiter((station[field] for station in stations), dtype=dtype, count=count)
+    
+    def count_column(field):
+        return _count_column([station.get(field) for station in stations])
+    
+    columns = {
+        'station_id': pd.Categorical([station['station_id'] for station in stations]),
+        'num_bikes_available': count_column('num_bikes_available'),
+        'num_docks_available': count_column('num_docks_available'),
+        'is_installed': column('is_installed', np.bool_),
+        'is_renting': column('is_renting', np.bool_),
+        'is_returning': column('is_returning', np.bool_),
+        'last_reported': column('last_reported', np.int64)
+    }
+    
+    # Most feeds use the num_bikes_available_types dict, so take that path in
+    # one pass and only fall back per station for the other formats
+    vehicle_types = [station.get('num_bikes_available_types') for station in stations]
+    if all(isinstance(bike_types, dict) for bike_types in vehicle_types):
+        columns['ebike'] = _count_column([bike_types.get('ebike', 0) for bike_types in vehicle_types])
+        columns['mechanical'] = _count_column([bike_types.get('mechanical', 0) for bike_types in vehicle_types])
+    else:
+        counts = [_vehicle_type_counts(station) for station in stations]
+        columns['ebike'] = _count_column([ebike for ebike, _ in counts])
+        columns['mechanical'] = _count_column([mechanical for _, mechanical in counts])
+    
+    return apply_schema(pd.DataFrame(columns), STATUS_SCHEMA)
+
+def measure_status_ingestion(raw, repeat=5):
+    """
+    Measure parse and frame-build cost of a raw station_status payload
+    
+    Args:
+        raw (bytes): Raw station_status response body
+        repeat (int): Runs to take the best time from
+        
+    Returns:
+        dict: Best 'parse_ms' and 'build_ms', and 'peak_kb' of traced memory
+    """
+    parse_times = []
+    build_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload = _json_loads(raw)
+        parsed = time.perf_counter()
+        parse_station_status(payload)
+        parse_times.append(parsed - started)
+        build_times.append(time.perf_counter() - parsed)
+    
+    tracemalloc.start()
+    try:
+        parse_station_status(_json_loads(raw))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    return {
+        'parse_ms': min(parse_times) * 1000,
+        'build_ms': min(build_times) * 1000,
+        'peak_kb': peak / 1024
+    }
+
 def query_station_status(url):
     """
-    Fetch station status data from the Toronto Bike Share API
+    Fetch station status data from the Toronto Bike Share API
+    
+    Args:
+        url (str): API endpoint URL for station status
+        
+    Returns:
+        pandas.DataFrame: DataFrame containing station status information
+    """
+    try:
+        return parse_station_status(fetch_gbfs_feed(url))
+        
+    except requests.RequestException as e:
+        st.error(f"Error fetching station status: {str(e)}")
+        return pd.DataFrame()
+    except (KeyError, TypeError, ValueError) as e:
+        st.error(f"Error parsing station status data: {str(e)}")
+        return pd.DataFrame()
+
+def parse_station_information(payload):
+    """
+    Convert a station_information payload into a DataFrame
+    
+    Args:
+        payload (dict): Parsed station_information feed
+        
+    Returns:
+        pandas.DataFrame: DataFrame containing station location information
+    """
+    stations = payload['data']['stations']
+    
+    # Process location data
+    location_data = []
+    for station in stations:
+        location_info = {
+            'station_id': station['station_id'],
+            'name': station['name'],
+            'lat': station['lat'],
+            'lon': station['lon'],
+            'capacity': station['capacity']
+        }
+        location_data.append(location_info)
+    
+    return apply_schema(pd.DataFrame(location_data), INFORMATION_SCHEMA)
+
+def load_station_information_frame(url, timeout=10):
+    """
+    Parsed station_information frame, rebuilt only when the snapshot changes
+    
+    Args:
+        url (str): API endpoint URL for station information
+        timeout (float): Revalidation request timeout in seconds
+        
+    Returns:
+        pandas.DataFrame: Station location frame (shared, treat as read-only)
+    """
+    payload = load_station_information(url, timeout=timeout)
+    cached = _station_info_frames.get(url)
+    if cached and cached[0] is payload:
+        return cached[1]
+    
+    frame = parse_station_information(payload)
+    _station_info_frames[url] = (payload, frame)
+    return frame
+
+def get_station_latlon(url):
+    """
+    Fetch station location data from the persisted station_information snapshot
+    
+    Args:
+        url (str): API endpoint URL for station information
+        
+    Returns:
+        pandas.DataFrame: DataFrame containing station location information
+    """
+    try:
+        return load_station_information_frame(url)
+        
+    except requests.RequestException as e:
+        st.error(f"Error fetching station locations: {str(e)}")
+        return pd.DataFrame()
+    except (KeyError, json.JSONDecodeError) as e:
+        st.error(f"Error parsing station location data: {str(e)}")
+        return pd.DataFrame()
+
+def fetch_station_frames(status_url, info_url, status_timeout=10, info_timeout=10):
+    """
+    Fetch station status and station information concurrently
+    
+    Each feed has its own timeout and fails independently: a failed feed
+    comes back as an empty DataFrame and its error is reported in 'errors'.
+    
+    Args:
+        status_url (str): API endpoint URL for station status
+        info_url (str): API endpoint URL for station information
+        status_timeout (float): Deadline for the station status feed in seconds
+        info_timeout (float): Deadline for the station information feed in seconds
+        
+    Returns:
+        tuple: (status_df, location_df, errors) where errors maps the feed
+            name ('status' or 'information') to an error message
+    """
+    futures = {
+        'status': (
+            _fetch_executor.submit(
+                lambda: parse_station_status(fetch_gbfs_feed(status_url, timeout=status_timeout))
+            ),
+            status_timeout
+        ),
+        'information': (
+            _fetch_executor.submit(
+                lambda: load_station_information_frame(info_url, timeout=info_timeout)
+            ),
+            info_timeout
+        )
+    }
+    
+    started = time.time()
+    frames = {}
+    errors = {}
+    for feed, (future, timeout) in futures.items():
+        try:
+            # Both requests are already in flight, so deadlines run from the start
+            frames[feed] = future.result(timeout=max(0, started + timeout - time.time()))
+        except FutureTimeoutError:
+            future.cancel()
+            errors[feed] = f"timed out after {timeout} s"
+            frames[feed] = pd.DataFrame()
+        except Exception as e:
+            errors[feed] = str(e)
+            frames[feed] = pd.DataFrame()
+    
+    return frames['status'], frames['information'], errors
+
+def join_latlon(status_df, location_df):
+    """
+    Join station status data with location data
+    
+    Args:
+        status_df (pandas.DataFrame): Station status data
+        location_df (pandas.DataFrame): Station location data
+        
+    Returns:
+        pandas.DataFrame: Combined DataFrame with status and location data
+    """
+    if status_df.empty or location_df.empty:
+        return pd.DataFrame()
+    
+    # Merge on station_id
+    merged_df = pd.merge(status_df, location_df, on='station_id', how='inner')
+    
+    # Filter for active stations only
+    active_stations = merged_df[
+        (merged_df['is_installed'] == 1) & 
+        (merged_df['is_renting'] == 1)
+    ].copy()
+    
+    # The merge loses the categorical ids when the two feeds list different stations
+    active_stations = apply_schema(active_stations, JOINED_SCHEMA)
+    active_stations['station_id'] = active_stations['station_id'].cat.remove_unused_categories()
+    
+    return active_stations
+
+def _metric_counts(rows):
+    """
+    Additive availability counts over the active stations among some rows
+    
+    Args:
+        rows (pandas.DataFrame): Joined station rows
+        
+    Returns:
+        dict: Station and bike counts (see compute_station_metrics)
+    """
+    active = (rows['is_installed'] == 1).to_numpy() & (rows['is_renting'] == 1).to_numpy()
+    bikes = rows['num_bikes_available'].to_numpy()[active]
+    docks = rows['num_docks_available'].to_numpy()[active]
+    ebikes = rows['ebike'].to_numpy()[active]
+    
+    # Same buckets as get_marker_color
+    return {
+        'total_stations': int(active.sum()),
+        'total_bikes': int(bikes.sum(dtype=np.int64)),
+        'total_ebikes': int(ebikes.sum(dtype=np.int64)),
+        'stations_with_bikes': int((bikes > 0).sum()),
+        'stations_with_docks': int((docks > 0).sum()),
+        'stations_with_ebikes': int((ebikes > 0).sum()),
+        'ready_stations': int((bikes >= 5).sum()),
+        'limited_stations': int(((bikes >= 1) & (bikes < 5)).sum()),
+        'empty_stations': int((bikes == 0).sum())
+    }
+
+def _with_rates(counts):
+    """Add the bike and dock availability percentages to a counts dict"""
+    total = counts['total_stations']
+    metrics = dict(counts)
+    metrics['bike_availability_rate'] = counts['stations_with_bikes'] / total * 100 if total else 0.0
+    metrics['dock_availability_rate'] = counts['stations_with_docks'] / total * 100 if total else 0.0
+    return metrics
+
+def compute_station_metrics(data):
+    """
+    Aggregate availability metrics for a station snapshot
+    
+    Args:
+        data (pandas.DataFrame): Joined station data
+        
+    Returns:
+        dict: 'total_stations', 'total_bikes', 'total_ebikes',
+            'stations_with_bikes', 'stations_with_docks', 'stations_with_ebikes',
+            'ready_stations' (5+ bikes), 'limited_stations' (1-4),
+            'empty_stations', 'bike_availability_rate' and
+            'dock_availability_rate' (percent)
+    """
+    return _with_rates(_metric_counts(data))
+
+def update_station_metrics(metrics, old_rows, new_rows):
+    """
+    Update snapshot metrics for rows that changed, without a full recount
+    
+    Args:
+        metrics (dict): Metrics from compute_station_metrics
+        old_rows (pandas.DataFrame): Changed rows before the update
+        new_rows (pandas.DataFrame): The same rows after the update
+        
+    Returns:
+        dict: Updated metrics
+    """
+    before = _metric_counts(old_rows)
+    after = _metric_counts(new_rows)
+    counts = {key: metrics[key] - before[key] + after[key] for key in before}
+    return _with_rates(counts)
+
+def build_station_table(status_df, location_df):
+    """
+    Build the incremental station table behind the published snapshots
+    
+    Unlike join_latlon this keeps every station (active or not) indexed by
+    station_id, so later status payloads can be applied row by row.
+    
+    Args:
+        status_df (pandas.DataFrame): Station status data
+        location_df (pandas.DataFrame): Station location data
+        
+    Returns:
+        dict: Table with the joined 'frame', its 'metrics', the 'status_ids'
+            it was built from and the 'location' frame it was joined with
+    """
+    frame = apply_schema(pd.merge(status_df, location_df, on='station_id', how='inner'), JOINED_SCHEMA)
+    frame.index = pd.Index(frame['station_id'].astype(str), name=None)
+    
+    return {
+        'frame': frame,
+        'metrics': compute_station_metrics(frame),
+        'status_ids': pd.Index(status_df['station_id'].astype(str)),
+        'location': location_df
+    }
+
+def update_station_table(table, status_df):
+    """
+    Apply a new station_status frame to the table in place
+    
+    Only stations whose last_reported moved are rewritten. A change in the
+    set of stations in the feed rebuilds the whole table instead.
+    
+    Args:
+        table (dict): Table from build_station_table
+        status_df (pandas.DataFrame): New station status data
+        
+    Returns:
+        pandas.Index: station_id of every row that changed
+    """
+    status_ids = pd.Index(status_df['station_id'].astype(str))
+    if not status_ids.equals(table['status_ids']):
+        table.update(build_station_table(status_df, table['location']))
+        return table['frame'].index
+    
+    frame = table['frame']
+    status = status_df.set_index(status_ids)
+    
+    # Feed order is stable between polls, so this is usually a plain view
+    if not status.index.equals(frame.index):
+        status = status.reindex(frame.index)
+    
+    changed = status['last_reported'].to_numpy() != frame['last_reported'].to_numpy()
+    if changed.any():
+        old_rows = frame[changed].copy()
+        for column in status_df.columns:
+            if column != 'station_id':
+                frame.loc[changed, column] = status[column].to_numpy()[changed]
+        table['metrics'] = update_station_metrics(table['metrics'], old_rows, frame[changed])
+    
+    return frame.index[changed]
+
+def station_table_frame(table):
+    """
+    Active stations of the table, shaped like join_latlon's output
+    
+    Args:
+        table (dict): Table from build_station_table
+        
+    Returns:
+        pandas.DataFrame: Independent copy of the active station rows
+    """
+    frame = table['frame']
+    active = frame[frame['is_installed'] & frame['is_renting']].reset_index(drop=True)
+    active['station_id'] = active['station_id'].cat.remove_unused_categories()
+    return active
+
+def build_station_snapshot(status_url, info_url, table=None):
+    """
+    Fetch both feeds and build an immutable joined station snapshot
+    
+    When the station table behind the previous snapshot is passed in, it is
+    updated in place with just the stations that reported since, and the
+    snapshot lists them under 'changed'.
+    
+    Args:
+        status_url (str): API endpoint URL for station status
+        info_url (str): API endpoint URL for station information
+        table (dict): Station table from the previous call, None to start over
+        
+    Returns:
+        tuple: (snapshot, table) where snapshot holds the joined 'data' frame,
+            its aggregate 'metrics', the 'changed' station ids, feed
+            'last_updated' and local 'published_at' time
+    """
+    status_df, location_df, errors = fetch_station_frames(status_url, info_url)
+    if errors:
+        raise RuntimeError("; ".join(f"{feed}: {error}" for feed, error in errors.items()))
+    
+    if table is None or table['location'] is not location_df:
+        table = build_station_table(status_df, location_df)
+        changed = table['frame'].index
+    else:
+        changed = update_station_table(table, status_df)
+    
+    # Latest raw status rows, inactive stations included, for the history recorder
+    table['status'] = status_df
+    
+    snapshot = {
+        'data': station_table_frame(table),
+        'metrics': dict(table['metrics']),
+        'changed': changed,
+        'last_updated': _feed_cache[status_url]['payload'].get('last_updated'),
+        'published_at': time.time()
+    }
+    return snapshot, table
+
+def _history_day_name(day):
+    """Partition name (UTC date) for a day number since the epoch"""
+    return time.strftime('%Y-%m-%d', time.gmtime(int(day) * SECONDS_PER_DAY))
+
+def _history_partitions(path):
+    """
+    List the day partitions in a history directory
+    
+    Returns:
+        dict: Partition name to the set of file extensions present ('.npy', '.log')
+    """
+    partitions = {}
+    for filename in os.listdir(path):
+        name, ext = os.path.splitext(filename)
+        if ext in ('.npy', '.log') and re.fullmatch(r"\d{4}-\d{2}-\d{2}", name):
+            partitions.setdefault(name, set()).add(ext)
+    return partitions
+
+def open_history(path=HISTORY_DIR):
+    """
+    Open (or create) a station history store for recording
+    
+    The store holds one partition per UTC day of last_reported: an append-only
+    '.log' of HISTORY_DTYPE records and, once compacted, a '.npy' array sorted
+    by station and time. Station ids are stored as codes into 'stations.json'.
+    Only one process should record into a store at a time.
+    
+    Args:
+        path (str): History directory
+        
+    Returns:
+        dict or None: Recorder for record_status, None if the directory is not writable
+    """
+    try:
+        os.makedirs(path, exist_ok=True)
+        stations_path = os.path.join(path, 'stations.json')
+        stations = []
+        if os.path.exists(stations_path):
+            with open(stations_path, 'r', encoding='utf-8') as f:
+                stations = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    return {
+        'path': path,
+        'stations': pd.Index(stations, dtype=object),
+        'last_reported': np.full(len(stations), -1, dtype=np.int64),
+        'maintained_at': 0.0,
+        'maintenance': None,
+        # Held while a partition's files are written, compacted or removed
+        'lock': threading.Lock()
+    }
+
+def _history_codes(recorder, station_ids):
+    """Map station ids to their history codes, registering new stations"""
+    codes = recorder['stations'].get_indexer(station_ids)
+    missing = codes < 0
+    if missing.any():
+        new_ids = pd.unique(station_ids[missing])
+        stations = recorder['stations'].append(pd.Index(new_ids, dtype=object))
+        
+        stations_path = os.path.join(recorder['path'], 'stations.json')
+        tmp_path = f"{stations_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(stations.tolist(), f)
+        os.replace(tmp_path, stations_path)
+        
+        recorder['stations'] = stations
+        recorder['last_reported'] = np.concatenate(
+            [recorder['last_reported'], np.full(len(new_ids), -1, dtype=np.int64)]
+        )
+        codes = stations.get_indexer(station_ids)
+    return codes
+
+def record_status(recorder, status_df):
+    """
+    Append the stations whose last_reported changed since the last call
+    
+    Args:
+        recorder (dict): Recorder from open_history
+        status_df (pandas.DataFrame): Parsed station_status frame
+        
+    Returns:
+        int: Number of records appended
+    """
+    if status_df.empty:
+        return 0
+    
+    codes = _history_codes(recorder, status_df['station_id'].astype(str).to_numpy(dtype=object))
+    last_reported = status_df['last_reported'].to_numpy(dtype=np.int64)
+    changed = last_reported != recorder['last_reported'][codes]
+    if not changed.any():
+        return 0
+    recorder['last_reported'][codes[changed]] = last_reported[changed]
+    
+    records = np.empty(int(changed.sum()), dtype=HISTORY_DTYPE)
+    records['station'] = codes[changed]
+    records['last_reported'] = last_reported[changed]
+    for column in HISTORY_COUNTS:
+        records[column] = status_df[column].to_numpy()[changed]
+    flags = np.zeros(len(records), dtype=np.uint8)
+    for bit, column in enumerate(HISTORY_FLAGS):
+        flags |= status_df[column].to_numpy(dtype=bool)[changed].astype(np.uint8) << bit
+    records['flags'] = flags
+    
+    days = records['last_reported'] // SECONDS_PER_DAY
+    with recorder['lock']:
+        for day in np.unique(days):
+            log_path = os.path.join(recorder['path'], f"{_history_day_name(day)}.log")
+            with open(log_path, 'ab') as f:
+                f.write(records[days == day].tobytes())
+    return len(records)
+
+def _read_history_partition(path, name, extensions):
+    """Read a day partition, compacted part first, then its append log"""
+    parts = []
+    if '.npy' in extensions:
+        parts.append(np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+    if '.log' in extensions:
+        parts.append(np.fromfile(os.path.join(path, f"{name}.log"), dtype=HISTORY_DTYPE))
+    if not parts:
+        return np.empty(0, dtype=HISTORY_DTYPE)
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+def compact_history(recorder, now=None):
+    """
+    Compact the append logs of finished days into sorted, de-duplicated partitions
+    
+    Args:
+        recorder (dict): Recorder from open_history
+        now (float): Current time, defaults to time.time()
+        
+    Returns:
+        int: Number of partitions compacted
+    """
+    path = recorder['path']
+    today = _history_day_name((now or time.time()) // SECONDS_PER_DAY)
+    
+    compacted = 0
+    for name, extensions in sorted(_history_partitions(path).items()):
+        if '.log' not in extensions or name >= today:
+            continue
+        
+        # A late report for this day must not be appended while its log is replaced
+        with recorder['lock']:
+            records = np.array(_read_history_partition(path, name, extensions))
+            order = np.lexsort((records['last_reported'], records['station']))
+            records = records[order]
+            
+            # Drop repeats of the same report (e.g. recorded again after a restart)
+            keep = np.ones(len(records), dtype=bool)
+            keep[1:] = (records['station'][1:] != records['station'][:-1]) | (records['last_reported'][1:] != records['last_reported'][:-1])
+            
+            npy_path = os.path.join(path, f"{name}.npy")
+            tmp_path = os.path.join(path, f"{name}.tmp.npy")
+            np.save(tmp_path, records[keep])
+            os.replace(tmp_path, npy_path)
+            os.remove(os.path.join(path, f"{name}.log"))
+        compacted += 1
+    return compacted
+
+def apply_history_retention(recorder, now=None, retention_days=HISTORY_RETENTION_DAYS):
+    """
+    Delete history partitions older than the retention period
+    
+    Args:
+        recorder (dict): Recorder from open_history
+        now (float): Current time, defaults to time.time()
+        retention_days (int): Days of history to keep (at least one)
+        
+    Returns:
+        int: Number of partitions removed
+    """
+    path = recorder['path']
+    oldest = _history_day_name((now or time.time()) // SECONDS_PER_DAY - max(retention_days, 1))
+    
+    removed = 0
+    for name, extensions in _history_partitions(path).items():
+        if name < oldest:
+            with recorder['lock']:
+                for ext in extensions:
+                    os.remove(os.path.join(path, f"{name}{ext}"))
+            removed += 1
+    return removed
+
+def _maintain_history(recorder, now):
+    """Compact, apply retention and retrain the forecast baselines once per finished day"""
+    try:
+        compacted = compact_history(recorder, now)
+        apply_history_retention(recorder, now)
+        
+        if compacted or not os.path.exists(FORECAST_PATH):
+            model = train_forecaster(recorder['path'], now=now)
+            if model is not None:
+                save_forecaster(model)
+    except Exception:
+        # Best effort: the next pass retries, and recording carries on meanwhile
+        pass
+
+def _record_history(recorder, status_df):
+    """Record a poll and start compaction, retention and forecast training about once an hour"""
+    try:
+        record_status(recorder, status_df)
+    except Exception:
+        # History is best effort; a full disk or bad row must not count as a feed failure
+        pass
+    
+    now = time.time()
+    running = recorder['maintenance']
+    if now - recorder['maintained_at'] >= HISTORY_MAINTENANCE_INTERVAL and (running is None or running.done()):
+        recorder['maintained_at'] = now
+        recorder['maintenance'] = _history_executor.submit(_maintain_history, recorder, now)
+
+def load_history(path=HISTORY_DIR, station_ids=None, start=None, end=None):
+    """
+    Load recorded station history
+    
+    Args:
+        path (str): History directory
+        station_ids (list): Only these stations, None for all
+        start (float): Earliest last_reported (epoch seconds), None for no limit
+        end (float): Latest last_reported (epoch seconds), None for no limit
+        
+    Returns:
+        pandas.DataFrame: One row per recorded report with 'station_id',
+            'last_reported', the counts and flags, sorted by station and time
+    """
+    columns = ['station_id', 'last_reported'] + HISTORY_COUNTS + HISTORY_FLAGS
+    try:
+        with open(os.path.join(path, 'stations.json'), 'r', encoding='utf-8') as f:
+            stations = pd.Index(json.load(f), dtype=object)
+        partitions = _history_partitions(path)
+    except (OSError, ValueError):
+        return pd.DataFrame(columns=columns)
+    
+    first = _history_day_name(start // SECONDS_PER_DAY) if start is not None else ''
+    last = _history_day_name(end // SECONDS_PER_DAY) if end is not None else '9999'
+    codes = None
+    if station_ids is not None:
+        codes = stations.get_indexer([str(station_id) for station_id in station_ids])
+        codes = codes[codes >= 0]
+    
+    parts = []
+    for name, extensions in sorted(partitions.items()):
+        if not first <= name <= last:
+            continue
+        records = _read_history_partition(path, name, extensions)
+        keep = np.ones(len(records), dtype=bool)
+        if start is not None:
+            keep &= records['last_reported'] >= start
+        if end is not None:
+            keep &= records['last_reported'] <= end
+        if codes is not None:
+            keep &= np.isin(records['station'], codes)
+        parts.append(records[keep])
+    
+    records = np.concatenate(parts) if parts else np.empty(0, dtype=HISTORY_DTYPE)
+    records = records[np.lexsort((records['last_reported'], records['station']))]
+    
+    history = {
+        'station_id': pd.Categorical.from_codes(records['station'].astype(np.int64), categories=stations),
+        'last_reported': records['last_reported']
+    }
+    for column in HISTORY_COUNTS:
+        history[column] = records[column]
+    for bit, column in enumerate(HISTORY_FLAGS):
+        history[column] = (records['flags'] >> bit & 1).astype(bool)
+    return pd.DataFrame(history, columns=columns)
+
+def _hour_of_week(timestamps, utc_offset=None):
+    """
+    Local hour of the week (0 is Monday 00:00) for epoch seconds
+    
+    Args:
+        timestamps (numpy.ndarray): Epoch seconds
+        utc_offset (float): Fixed UTC offset in seconds, None to convert each
+            timestamp to FORECAST_TIMEZONE (exact across DST changes)
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if utc_offset is None:
+        local = pd.to_datetime(timestamps, unit='s', utc=True).tz_convert(FORECAST_TIMEZONE)
+        return np.asarray(local.dayofweek * 24 + local.hour, dtype=np.int64)
+    
+    # The epoch fell on a Thursday, 72 hours into its week
+    return ((timestamps + int(utc_offset)) // 3600 + 72) % HOURS_PER_WEEK
+
+def _utc_offset(timestamp):
+    """UTC offset of FORECAST_TIMEZONE in seconds at a moment"""
+    local = pd.Timestamp(int(timestamp), unit='s', tz='UTC').tz_convert(FORECAST_TIMEZONE)
+    return local.utcoffset().total_seconds()
+
+def train_forecaster(path=HISTORY_DIR, days=FORECAST_TRAINING_DAYS, now=None):
+    """
+    Train per-station hour-of-week availability baselines from recorded history
+    
+    Each report counts for the time it held, up to FORECAST_MAX_HOLD seconds,
+    so the baselines are time averages rather than averages over reports. A
+    bucket seen for only a few hours is shrunk towards the station's overall
+    average. Partitions are read one day at a time to bound memory.
+    
+    Args:
+        path (str): History directory
+        days (int): Days of history to train on
+        now (float): Current time, defaults to time.time()
+    
+    Returns:
+        dict or None: Model with 'station_id' and, per count column, the mean
+            and variance arrays of shape (stations, 168); None without history
+    """
+    try:
+        with open(os.path.join(path, 'stations.json'), 'r', encoding='utf-8') as f:
+            stations = json.load(f)
+        partitions = _history_partitions(path)
+    except (OSError, ValueError):
+        return None
+    
+    now = now or time.time()
+    first = _history_day_name(now // SECONDS_PER_DAY - days)
+    cells = len(stations) * HOURS_PER_WEEK
+    held = np.zeros(cells)
+    sums = {column: np.zeros(cells) for column in HISTORY_COUNTS}
+    squares = {column: np.zeros(cells) for column in HISTORY_COUNTS}
+    
+    for name, extensions in sorted(partitions.items()):
+        if name < first:
+            continue
+        records = _read_history_partition(path, name, extensions)
+        # Skip stations registered after stations.json was read, and uninstalled ones
+        records = records[(records['station'] < len(stations)) & ((records['flags'] & 1) == 1)]
+        if len(records) == 0:
+            continue
+        records = records[np.lexsort((records['last_reported'], records['station']))]
+        
+        # Seconds until the station's next report, capped for gaps and the last report
+        reported = records['last_reported']
+        hold = np.full(len(records), FORECAST_MAX_HOLD, dtype=np.float64)
+        same = records['station'][1:] == records['station'][:-1]
+        hold[:-1] = np.where(same, np.minimum(np.diff(reported), FORECAST_MAX_HOLD), FORECAST_MAX_HOLD)
+        
+        cell = records['station'].astype(np.int64) * HOURS_PER_WEEK + _hour_of_week(reported)
+        held += np.bincount(cell, weights=hold, minlength=cells)
+        for column in HISTORY_COUNTS:
+            values = records[column].astype(np.float64)
+            sums[column] += np.bincount(cell, weights=hold * values, minlength=cells)
+            squares[column] += np.bincount(cell, weights=hold * values * values, minlength=cells)
+    
+    if not held.any():
+        return None
+    
+    held = held.reshape(-1, HOURS_PER_WEEK)
+    station_held = held.sum(axis=1, keepdims=True)
+    shrink = held / (held + FORECAST_PRIOR_SECONDS)
+    
+    model = {'station_id': np.array(stations, dtype=str), 'trained_at': np.float64(now)}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in HISTORY_COUNTS:
+            total = sums[column].reshape(-1, HOURS_PER_WEEK)
+            total_sq = squares[column].reshape(-1, HOURS_PER_WEEK)
+            station_mean = total.sum(axis=1, keepdims=True) / station_held
+            station_var = total_sq.sum(axis=1, keepdims=True) / station_held - station_mean ** 2
+            bucket_mean = np.where(held > 0, total / held, station_mean)
+            bucket_var = np.where(held > 0, total_sq / held - bucket_mean ** 2, station_var)
+            
+            # Stations never seen stay NaN and fall back to the live counts
+            model[column] = (shrink * bucket_mean + (1 - shrink) * station_mean).astype(np.float32)
+            model[f"{column}_var"] = np.maximum(shrink * bucket_var + (1 - shrink) * station_var, 0).astype(np.float32)
+    return model
+
+def save_forecaster(model, path=FORECAST_PATH):
+    """Write a trained model atomically so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **model)
+    os.replace(tmp_path, path)
+
+def load_forecaster(path=FORECAST_PATH):
+    """
+    Load a model written by save_forecaster
+    
+    Returns:
+        dict or None: Model with the station ids as a pandas Index, None if
+            there is no readable model
+    """
+    try:
+        with np.load(path) as archive:
+            model = {key: archive[key] for key in archive.files}
+    except (OSError, ValueError):
+        return None
+    
+    model['station_id'] = pd.Index(model['station_id'].astype(object))
+    return model
+
+def get_forecaster(path=FORECAST_PATH):
+    """
+    The current model, reloaded when the poller writes a newer one
+    
+    Returns:
+        dict or None: Model from load_forecaster, None if none was trained yet
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    
+    if _forecast['mtime'] != mtime:
+        _forecast['model'] = load_forecaster(path)
+        _forecast['mtime'] = mtime
+    return _forecast['model']
+
+def observe_forecast(state, data):
+    """
+    Update the live forecast state from a station snapshot
+    
+    The state keeps each station's latest counts and an exponentially smoothed
+    trend (change per minute over about FORECAST_TREND_MINUTES), updated only
+    for stations whose last_reported moved.
+    
+    Args:
+        state (dict): Previous state, None to start one
+        data (pandas.DataFrame): Joined station data
+    
+    Returns:
+        dict: New state with 'station_id', 'last_reported', 'capacity' and,
+            per count column, the latest count and its '_trend'
+    """
+    station_ids = pd.Index(data['station_id'].astype(str).to_numpy(dtype=object))
+    reported = data['last_reported'].to_numpy(dtype=np.int64)
+    new_state = {
+        'station_id': station_ids,
+        'last_reported': reported,
+        'capacity': data['capacity'].to_numpy(dtype=np.float64)
+    }
+    
+    if state is None:
+        previous = np.full(len(station_ids), -1)
+    else:
+        previous = state['station_id'].get_indexer(station_ids)
+    known = previous >= 0
+    
+    elapsed = np.zeros(len(station_ids))
+    if known.any():
+        elapsed[known] = (reported[known] - state['last_reported'][previous[known]]) / 60
+    moved = known & (elapsed > 0)
+    keep = np.exp(-elapsed / FORECAST_TREND_MINUTES)
+    
+    for column in HISTORY_COUNTS:
+        values = data[column].to_numpy(dtype=np.float64)
+        trend = np.zeros(len(station_ids))
+        if known.any():
+            trend[known] = state[f"{column}_trend"][previous[known]]
+            rate = np.zeros(len(station_ids))
+            rate[moved] = (values[moved] - state[column][previous[moved]]) / elapsed[moved]
+            trend = np.where(moved, keep * trend + (1 - keep) * rate, trend)
+        new_state[column] = values
+        new_state[f"{column}_trend"] = trend
+    return new_state
+
+def _observe_forecast(snapshot):
+    """Feed a published snapshot into this process's forecast state"""
+    _forecast['state'] = observe_forecast(_forecast['state'], snapshot['data'])
+
+def predict_availability(station_ids, horizon_minutes, model=None, state=None, now=None):
+    """
+    Predict station counts some minutes ahead, for a batch of stations at once
+    
+    The latest count's deviation from the station's hour-of-week baseline,
+    extended by the damped trend, fades with the time since it was reported,
+    and the spread grows from zero towards the baseline's.
+    
+    Args:
+        station_ids (list): Stations to predict
+        horizon_minutes (float or numpy.ndarray): Minutes ahead, one value for
+            all stations or one per station (e.g. each walking time)
+        model (dict): Model from get_forecaster, defaults to the current one
+        state (dict): State from observe_forecast, defaults to the poller's
+        now (float): Current time, defaults to time.time()
+    
+    Returns:
+        dict: Per count column (HISTORY_COUNTS), arrays of the expected count
+            and its '_std', aligned with station_ids; NaN for unknown stations
+    """
+    model = get_forecaster() if model is None else model
+    state = _forecast['state'] if state is None else state
+    now = now or time.time()
+    
+    station_ids = [str(station_id) for station_id in station_ids]
+    count = len(station_ids)
+    horizon = np.broadcast_to(np.asarray(horizon_minutes, dtype=np.float64), (count,))
+    
+    prediction = {}
+    if state is None:
+        # No snapshot observed yet, so nothing to start from
+        for column in HISTORY_COUNTS:
+            prediction[column] = prediction[f"{column}_std"] = np.full(count, np.nan)
+        return prediction
+    
+    rows = state['station_id'].get_indexer(station_ids)
+    live = rows >= 0
+    
+    # Minutes from the last report to the arrival
+    reported = np.where(live, state['last_reported'][rows], int(now))
+    ahead = np.maximum(horizon + (now - reported) / 60, 0)
+    fade = np.exp(-ahead / FORECAST_DECAY_MINUTES)
+    # The trend runs for about FORECAST_TREND_MINUTES, then reverts with the deviation
+    damped = FORECAST_TREND_MINUTES * (1 - np.exp(-ahead / FORECAST_TREND_MINUTES)) * fade
+    capacity = np.where(live, state['capacity'][rows], np.nan)
+    
+    baseline = model is not None
+    if baseline:
+        model_rows = model['station_id'].get_indexer(station_ids)
+        trained = model_rows >= 0
+        model_rows = np.where(trained, model_rows, 0)
+        offset = _utc_offset(now)
+        then = _hour_of_week(reported, offset)
+        target = _hour_of_week(now + horizon * 60, offset)
+    
+    for column in HISTORY_COUNTS:
+        current = np.where(live, state[column][rows], np.nan)
+        trend = np.where(live, state[f"{column}_trend"][rows], 0)
+        expected = current + trend * damped
+        variance = (current + 1) * (1 - fade ** 2)
+        
+        if baseline:
+            mean = model[column][model_rows, target].astype(np.float64)
+            known = trained & ~np.isnan(mean)
+            anomaly = current - model[column][model_rows, then]
+            expected = np.where(known, mean + anomaly * fade + trend * damped, expected)
+            variance = np.where(known, model[f"{column}_var"][model_rows, target] * (1 - fade ** 2), variance)
+        
+        prediction[column] = np.clip(expected, 0, capacity)
+        prediction[f"{column}_std"] = np.where(live, np.sqrt(variance), np.nan)
+    return prediction
+
+def _publish_snapshot(snapshot):
+    """Swap in a new snapshot and wake up anyone waiting for the first one"""
+    global _latest_snapshot
+    
+    _observe_forecast(snapshot)
+    
+    with _snapshot_ready:
+        _latest_snapshot = snapshot
+        _snapshot_ready.notify_all()
+
+def _poll_feeds(status_url, info_url):
+    """
+    Background loop that refreshes the station snapshot on the feed TTL
+    
+    Args:
+        status_url (str): API endpoint URL for station status
+        info_url (str): API endpoint URL for station information
+    """
+    failures = 0
+    table = None
+    recorder = None
+    while not _poller_stop.is_set():
+        if not _acquire_fetcher_role():
+            # Another process on this host fetches; follow its shared snapshots
+            _follow_shared_snapshot()
+            _poller_stop.wait(SHARED_SNAPSHOT_POLL)
+            continue
+        
+        if recorder is None and HISTORY_ENABLED:
+            recorder = open_history()
+        
+        try:
+            snapshot, table = build_station_snapshot(status_url, info_url, table)
+            _publish_snapshot(snapshot)
+            failures = 0
+            
+            if recorder is not None:
+                _record_history(recorder, table['status'])
+            if SHARED_SNAPSHOTS and fcntl is not None:
+                _share_snapshot(snapshot)
+            
+            # Sleep until the status feed's own TTL runs out
+            entry = _feed_cache.get(status_url)
+            delay = entry['expires_at'] - time.time() if entry else FEED_MIN_TTL
+            delay = max(delay, FEED_MIN_TTL)
+        except Exception:
+            # Keep serving the last snapshot and back off while upstream is down
+            failures += 1
+            delay = min(FEED_MIN_TTL * 2 ** failures, POLLER_MAX_BACKOFF)
+        
+        _poller_stop.wait(delay)
+
+def start_feed_poller(status_url, info_url):
+    """
+    Start the process-wide background feed poller if it isn't running yet
+    
+    Safe to call on every Streamlit rerun; only the first call starts a thread.
+    
+    Args:
+        status_url (str): API endpoint URL for station status
+        info_url (str): API endpoint URL for station information
+    """
+    global _poller_thread
+    
+    with _snapshot_ready:
+        if _poller_thread is not None and _poller_thread.is_alive():
+            return
+        
+        _poller_stop.clear()
+        _poller_thread = threading.Thread(
+            target=_poll_feeds,
+            args=(status_url, info_url),
+            name="gbfs-feed-poller",
+            daemon=True
+        )
+        _poller_thread.start()
+
+def stop_feed_poller():
+    """Ask the background feed poller to exit"""
+    _poller_stop.set()
+
+def get_latest_snapshot(timeout=None):
+    """
+    Read the most recent station snapshot published by the poller
+    
+    Args:
+        timeout (float): Seconds to wait for the first snapshot, None to not wait
+        
+    Returns:
+        dict or None: Latest snapshot (treat as read-only), None if none yet
+    """
+    with _snapshot_ready:
+        if _latest_snapshot is None and timeout:
+            _snapshot_ready.wait_for(lambda: _latest_snapshot is not None, timeout)
+        return _latest_snapshot
+
+def _acquire_fetcher_role(path=SHARED_SNAPSHOT_DIR):
+    """
+    Whether this process should fetch the feeds itself
+    
+    The first process to take the host-wide fetcher lock keeps it for its
+    lifetime; the others follow its shared snapshots and take over if it exits.
+    """
+    global _fetcher_lock_file
+    
+    if _fetcher_lock_file is not None or not SHARED_SNAPSHOTS or fcntl is None:
+        return True
+    
+    try:
+        os.makedirs(path, exist_ok=True)
+        lock_file = open(os.path.join(path, 'fetcher.lock'), 'a')
+    except OSError:
+        return True
+    
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    
+    _fetcher_lock_file = lock_file
+    return True
+
+def write_shared_snapshot(snapshot, path=SHARED_SNAPSHOT_DIR):
+    """
+    Publish a snapshot for the other processes on this host
+    
+    The frame is written as a NumPy structured array (categorical and string
+    columns as codes, their categories in a JSON sidecar with the rest of
+    the snapshot), then the 'CURRENT' generation pointer is swapped
+    atomically. Only the latest SHARED_SNAPSHOT_KEEP generations are kept.
+    
+    Args:
+        snapshot (dict): Snapshot from build_station_snapshot
+        path (str): Shared snapshot directory
+        
+    Returns:
+        int: Generation number written
+    """
+    os.makedirs(path, exist_ok=True)
+    data = snapshot['data']
+    
+    fields = []
+    columns = {}
+    meta = {'columns': [], 'categories': {}}
+    for column in data.columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == 'string' or values.dtype == object:
+            kind = 'category' if isinstance(values.dtype, pd.CategoricalDtype) else 'string'
+            values = values.astype('category')
+            meta['categories'][column] = [str(category) for category in values.cat.categories]
+            columns[column] = values.cat.codes.to_numpy(dtype=np.int32)
+        else:
+            kind = 'value'
+            columns[column] = values.to_numpy()
+        meta['columns'].append([column, kind])
+        fields.append((column, columns[column].dtype))
+    
+    records = np.empty(len(data), dtype=fields)
+    for column, values in columns.items():
+        records[column] = values
+    
+    meta.update({
+        'metrics': snapshot['metrics'],
+        'changed': [str(station_id) for station_id in snapshot['changed']],
+        'last_updated': snapshot['last_updated'],
+        'published_at': snapshot['published_at']
+    })
+    
+    pointer_path = os.path.join(path, 'CURRENT')
+    current = _read_generation(path)
+    generation = (current or 0) + 1
+    name = f"snapshot-{generation:012d}"
+    
+    np.save(os.path.join(path, f"{name}.tmp.npy"), records)
+    os.replace(os.path.join(path, f"{name}.tmp.npy"), os.path.join(path, f"{name}.npy"))
+    with open(os.path.join(path, f"{name}.json.tmp"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(path, f"{name}.json.tmp"), os.path.join(path, f"{name}.json"))
+    with open(f"{pointer_path}.tmp", 'w', encoding='utf-8') as f:
+        f.write(str(generation))
+    os.replace(f"{pointer_path}.tmp", pointer_path)
+    
+    # Readers keep mapped files usable after they are unlinked
+    for filename in os.listdir(path):
+        match = re.fullmatch(r"snapshot-(\d+)\.(npy|json)", filename)
+        if match and int(match.group(1)) <= generation - SHARED_SNAPSHOT_KEEP:
+            try:
+                os.remove(os.path.join(path, filename))
+            except OSError:
+                pass
+    return generation
+
+def _read_generation(path):
+    """Current shared snapshot generation, None if nothing was published yet"""
+    try:
+        with open(os.path.join(path, 'CURRENT'), 'r', encoding='utf-8') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+def read_shared_snapshot(path=SHARED_SNAPSHOT_DIR):
+    """
+    Open the current shared snapshot without copying its numeric columns
+    
+    The snapshot is reloaded only when the generation pointer moves.
+    
+    Args:
+        path (str): Shared snapshot directory
+        
+    Returns:
+        dict or None: Snapshot like build_station_snapshot's, None if none is published
+    """
+    generation = _read_generation(path)
+    if generation is None:
+        return None
+    if generation == _shared_snapshot['generation']:
+        return _shared_snapshot['snapshot']
+    
+    name = f"snapshot-{generation:012d}"
+    try:
+        with open(os.path.join(path, f"{name}.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        records = np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    
+    columns = {}
+    for column, kind in meta['columns']:
+        if kind == 'value':
+            columns[column] = records[column]
+            continue
+        categories = meta['categories'][column]
+        values = pd.Categorical.from_codes(np.asarray(records[column]), categories=categories)
+        columns[column] = values if kind == 'category' else pd.array(np.asarray(values), dtype='string')
+    
+    snapshot = {
+        'data': pd.DataFrame(columns, copy=False),
+        'metrics': meta['metrics'],
+        'changed': pd.Index(meta['changed'], dtype=object),
+        'last_updated': meta['last_updated'],
+        'published_at': meta['published_at']
+    }
+    _shared_snapshot['generation'] = generation
+    _shared_snapshot['snapshot'] = snapshot
+    return snapshot
+
+def _share_snapshot(snapshot):
+    """Write the shared snapshot; a full or read-only disk must not stop the poller"""
+    try:
+        write_shared_snapshot(snapshot)
+    except OSError:
+        pass
+
+def _follow_shared_snapshot():
+    """Publish the fetcher's latest shared snapshot in this process"""
+    previous = _shared_snapshot['snapshot']
+    snapshot = read_shared_snapshot()
+    if snapshot is not None and snapshot is not previous:
+        _publish_snapshot(snapshot)
+
+def normalize_address(address):
+    """
+    Normalize an address into a cache / gazetteer key
+    
+    Lower-cases, turns punctuation into spaces and drops the trailing city,
+    province and country words the apps append to every query.
+    
+    Args:
+        address (str): Free-form address
+        
+    Returns:
+        str: Normalized key such as "queen st w spadina ave"
+    """
+    words = re.sub(r"[^a-z0-9]+", " ", address.lower()).split()
+    while words and words[-1] in ('toronto', 'ontario', 'on', 'canada'):
+        words.pop()
+    return " ".join(words)
+
+def _load_gazetteer():
+    """
+    Build the local gazetteer from the optional file and known station names
+    
+    Rebuilt only when the gazetteer file or a station_information snapshot
+    changes.
+    
+    Returns:
+        dict: Normalized name -> [latitude, longitude]
+    """
+    global _gazetteer, _gazetteer_sources
+    
+    try:
+        file_stamp = os.path.getmtime(GAZETTEER_PATH)
+    except OSError:
+        file_stamp = None
+    sources = (file_stamp,) + tuple(id(snapshot['payload']) for snapshot in list(_station_info.values()))
+    
+    if _gazetteer is not None and sources == _gazetteer_sources:
+        return _gazetteer
+    
+    gazetteer = {}
+    
+    # Station names are mostly intersections ("Queen St W / Spadina Ave")
+    for snapshot in list(_station_info.values()):
+        for station in snapshot['payload']['data']['stations']:
+            key = normalize_address(station.get('name', ''))
+            if key:
+                gazetteer.setdefault(key, [station['lat'], station['lon']])
+    
+    if file_stamp is not None:
+        try:
+            entries = pd.read_csv(GAZETTEER_PATH, dtype={'name': str})
+            for name, lat, lon in zip(entries['name'], entries['lat'], entries['lon']):
+                key = normalize_address(str(name))
+                if key:
+                    gazetteer[key] = [float(lat), float(lon)]
+        except (OSError, KeyError, ValueError):
+            pass
+    
+    _gazetteer = gazetteer
+    _gazetteer_sources = sources
+    return gazetteer
+
+def _gazetteer_lookup(key):
+    """
+    Resolve a normalized address from the local gazetteer
+    
+    Postal codes fall back to their forward sortation area (first three
+    characters) when the full code isn't listed.
+    
+    Args:
+        key (str): Normalized address
+        
+    Returns:
+        list or None: [latitude, longitude] if known locally
+    """
+    gazetteer = _load_gazetteer()
+    if key in gazetteer:
+        return gazetteer[key]
+    
+    postal_code = re.fullmatch(r"([a-z]\d[a-z]) ?(\d[a-z]\d)?", key)
+    if postal_code:
+        for candidate in (" ".join(filter(None, postal_code.groups())), postal_code.group(1)):
+            if candidate in gazetteer:
+                return gazetteer[candidate]
+    return None
+
+def _geocode_cache_connect(path):
+    """
+    This thread's connection to the persistent geocode cache
+    
+    Connections are kept per thread (sqlite3 connections cannot be shared
+    between threads) and the table is created once per process.
+    """
+    connections = getattr(_geocode_connections, 'by_path', None)
+    if connections is None:
+        connections = _geocode_connections.by_path = {}
+    
+    connection = connections.get(path)
+    if connection is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=5)
+        connections[path] = connection
+    
+    if path not in _geocode_schemas:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS geocode (address TEXT PRIMARY KEY, lat REAL, lon REAL, created_at REAL)"
+        )
+        _geocode_schemas.add(path)
+    return connection
+
+def _geocode_cache_reset(path):
+    """Drop this thread's connection after an error so the next call reconnects"""
+    _geocode_schemas.discard(path)
+    connection = getattr(_geocode_connections, 'by_path', {}).pop(path, None)
+    if connection is not None:
+        connection.close()
+
+def _geocode_cache_get(key, path=GEOCODE_CACHE_PATH):
+    """
+    Look up a normalized address in the persistent geocode cache
+    
+    Args:
+        key (str): Normalized address
+        path (str): SQLite cache file path
+        
+    Returns:
+        list or None: [latitude, longitude] if cached
+    """
+    try:
+        connection = _geocode_cache_connect(path)
+        row = connection.execute("SELECT lat, lon FROM geocode WHERE address = ?", (key,)).fetchone()
+        return [row[0], row[1]] if row else None
+    except (OSError, sqlite3.Error):
+        _geocode_cache_reset(path)
+        return None
+
+def _geocode_cache_put(key, location, path=GEOCODE_CACHE_PATH):
+    """
+    Store a geocoding result in the persistent cache
+    
+    Args:
+        key (str): Normalized address
+        location (list): [latitude, longitude]
+        path (str): SQLite cache file path
+    """
+    try:
+        connection = _geocode_cache_connect(path)
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)",
+                (key, location[0], location[1], time.time())
+            )
+    except (OSError, sqlite3.Error):
+        # Losing the persistent copy only costs a future Nominatim call
+        _geocode_cache_reset(path)
+
+def _geocode_remember(key, location):
+    """Put a result into the in-memory LRU"""
+    with _geocode_lock:
+        _geocode_lru[key] = location
+        _geocode_lru.move_to_end(key)
+        while len(_geocode_lru) > GEOCODE_LRU_SIZE:
+            _geocode_lru.popitem(last=False)
+
+def _nominatim_geocode(address):
+    """
+    Geocode through Nominatim, respecting its one request per second policy
+    
+    Args:
+        address (str): Street address to geocode
+        
+    Returns:
+        list or None: [latitude, longitude] if found
+    """
+    global _nominatim_last_call
+    
+    host = 'nominatim.openstreetmap.org'
+    _circuit_check(host)
+    
+    with _nominatim_lock:
+        wait = _nominatim_last_call + NOMINATIM_MIN_INTERVAL - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            location = get_geolocator().geocode(address, timeout=10)
+        except Exception:
+            _circuit_record(host, False)
+            raise
+        finally:
+            _nominatim_last_call = time.time()
+    _circuit_record(host, True)
+    
+    return [location.latitude, location.longitude] if location else None
+
+def geocode(address):
+    """
+    Convert an address to latitude and longitude coordinates
+    
+    Lookups go through the in-memory LRU, the local gazetteer and the
+    persistent cache before falling back to Nominatim.
+    
+    Args:
+        address (str): Street address to geocode
+        
+    Returns:
+        list or str: [latitude, longitude] if successful, empty string if failed
+    """
+    key = normalize_address(address)
+    if not key:
+        return ''
+    
+    with _geocode_lock:
+        location = _geocode_lru.get(key)
+        if location is not None:
+            _geocode_lru.move_to_end(key)
+            return list(location)
+    
+    try:
+        location = _gazetteer_lookup(key) or _geocode_cache_get(key)
+        if location is None:
+            location = _nominatim_geocode(address)
+            if location is None:
+                return ''
+            _geocode_cache_put(key, location)
+        
+        _geocode_remember(key, location)
+        return list(location)
+            
+    except Exception as e:
+        st.error(f"Geocoding error: {str(e)}")
+        return ''
+
+def get_marker_color(num_bikes):
+    """
+    Determine marker color based on number of available bikes
+    
+    Args:
+        num_bikes (int): Number of available bikes at station
+        
+    Returns:
+        str: Color code for the marker
+    """
+    if num_bikes >= 5:
+        return 'green'
+    elif num_bikes >= 1:
+        return 'orange'
+    else:
+        return 'red'
+
+def calculate_distance(point1, point2):
+    """
+    Calculate distance between two geographic points
+    
+    Args:
+        point1 (list): [latitude, longitude] of first point
+        point2 (list): [latitude, longitude] of second point
+        
+    Returns:
+        float: Distance in kilometers
+    """
+    return geodesic(point1, point2).kilometers
+
+def haversine_km(point, lats, lons):
+    """
+    Vectorized great-circle distance from one point to many
+    
+    Args:
+        point (list): [latitude, longitude] of the origin (or a pair of
+            arrays for element-wise distances)
+        lats (numpy.ndarray): Latitudes of the targets
+        lons (numpy.ndarray): Longitudes of the targets
+        
+    Returns:
+        numpy.ndarray: Distances in kilometers
+    """
+    lat1 = np.radians(point[0])
+    lon1 = np.radians(point[1])
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+    
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def build_station_index(stations, cell_km=STATION_INDEX_CELL_KM):
+    """
+    Build a grid bucket spatial index over station coordinates
+    
+    Stations are bucketed into roughly cell_km x cell_km lat/lon cells, so
+    nearest and radius queries only look at the cells around the query point.
+    
+    Args:
+        stations (pandas.DataFrame): Frame with 'station_id', 'lat' and 'lon'
+        cell_km (float): Approximate cell size in kilometers
+        
+    Returns:
+        dict: Spatial index for index_nearest / index_within
+    """
+    lats = stations['lat'].to_numpy(dtype=np.float64)
+    lons = stations['lon'].to_numpy(dtype=np.float64)
+    
+    cell_lat = cell_km / KM_PER_DEGREE_LAT
+    ref_lat = float(np.mean(lats)) if len(lats) else 0.0
+    cell_lon = cell_lat / max(np.cos(np.radians(ref_lat)), 0.01)
+    
+    # Smallest real cell dimension bounds how far each ring of cells reaches
+    max_abs_lat = float(np.max(np.abs(lats))) if len(lats) else 0.0
+    min_cell_km = min(cell_km, cell_lon * KM_PER_DEGREE_LAT * np.cos(np.radians(max_abs_lat)))
+    
+    rows = np.floor(lats / cell_lat).astype(np.int64)
+    cols = np.floor(lons / cell_lon).astype(np.int64)
+    
+    cells = {}
+    order = np.lexsort((cols, rows))
+    if len(order):
+        keys = np.stack([rows[order], cols[order]], axis=1)
+        starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)])
+        for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+            cells[(int(keys[start, 0]), int(keys[start, 1]))] = order[start:end]
+    
+    return {
+        'station_id': stations['station_id'].to_numpy(),
+        'lookup': pd.Index(stations['station_id']),
+        'lat': lats,
+        'lon': lons,
+        'cell_lat': cell_lat,
+        'cell_lon': cell_lon,
+        'min_cell_km': min_cell_km,
+        'cells': cells,
+        'row_range': (min(r for r, _ in cells), max(r for r, _ in cells)) if cells else (0, -1),
+        'col_range': (min(c for _, c in cells), max(c for _, c in cells)) if cells else (0, -1)
+    }
+
+def _index_ring(index, row, col, ring):
+    """
+    Positions of the stations in the square ring of cells around a cell
+    
+    Args:
+        index (dict): Spatial index from build_station_index
+        row (int): Row of the center cell
+        col (int): Column of the center cell
+        ring (int): Ring number (0 is the center cell itself)
+        
+    Returns:
+        numpy.ndarray: Station positions in the index
+    """
+    cells = index['cells']
+    if ring == 0:
+        keys = [(row, col)]
+    else:
+        keys = [(row - ring, c) for c in range(col - ring, col + ring + 1)]
+        keys += [(row + ring, c) for c in range(col - ring, col + ring + 1)]
+        keys += [(r, col - ring) for r in range(row - ring + 1, row + ring)]
+        keys += [(r, col + ring) for r in range(row - ring + 1, row + ring)]
+    
+    found = [cells[key] for key in keys if key in cells]
+    return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+def _index_scan(index, row, col, first_ring, last_ring):
+    """
+    Positions of the stations in rings first_ring..last_ring, by scanning cells
+    
+    Cheaper than probing ring by ring once the rings are larger than the
+    number of occupied cells (sparse, multi-city networks).
+    
+    Args:
+        index (dict): Spatial index from build_station_index
+        row (int): Row of the center cell
+        col (int): Column of the center cell
+        first_ring (int): Innermost ring to include
+        last_ring (int): Outermost ring to include
+        
+    Returns:
+        numpy.ndarray: Station positions in the index
+    """
+    found = [
+        positions for (r, c), positions in index['cells'].items()
+        if first_ring <= max(abs(r - row), abs(c - col)) <= last_ring
+    ]
+    return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+def _index_max_ring(index, row, col):
+    """Ring number beyond which the index has no cells"""
+    row_min, row_max = index['row_range']
+    col_min, col_max = index['col_range']
+    return max(abs(row - row_min), abs(row - row_max), abs(col - col_min), abs(col - col_max))
+
+def index_mask(index, data, mask):
+    """
+    Align an availability predicate on a station frame to index positions
+    
+    Args:
+        index (dict): Spatial index from build_station_index
+        data (pandas.DataFrame): Station data with 'station_id'
+        mask (pandas.Series): Boolean predicate over the rows of data
+        
+    Returns:
+        numpy.ndarray: Boolean array over index positions; stations missing
+            from data are treated as not eligible
+    """
+    positions = index['lookup'].get_indexer(data['station_id'])
+    keep = (positions >= 0) & mask.to_numpy(dtype=bool)
+    
+    eligible = np.zeros(len(index['station_id']), dtype=bool)
+    eligible[positions[keep]] = True
+    return eligible
+
+def _index_filter(positions, eligible):
+    """Keep only the positions whose station passes the availability predicate"""
+    if eligible is None or positions.size == 0:
+        return positions
+    return positions[eligible[positions]]
+
+def index_nearest(index, point, k=1, eligible=None):
+    """
+    Find the k nearest stations to a point using the spatial index
+    
+    Rings of cells are scanned outwards from the point's cell until the k-th
+    best distance is closer than anything an unscanned ring could hold.
+    
+    Args:
+        index (dict): Spatial index from build_station_index
+        point (list): [latitude, longitude] of the query
+        k (int): Number of stations to return
+        eligible (numpy.ndarray): Optional availability predicate from index_mask
+        
+    Returns:
+        tuple: (positions, distances_km) sorted nearest first
+    """
+    row = int(np.floor(point[0] / index['cell_lat']))
+    col = int(np.floor(point[1] / index['cell_lon']))
+    
+    max_ring = _index_max_ring(index, row, col)
+    positions = []
+    distances = []
+    found = 0
+    for ring in range(max_ring + 1):
+        if ring and 8 * ring >= len(index['cells']):
+            # Rings now probe more keys than there are cells, finish in one scan
+            ring_positions = _index_scan(index, row, col, ring, max_ring)
+            last = True
+        else:
+            ring_positions = _index_ring(index, row, col, ring)
+            last = False
+        
+        ring_positions = _index_filter(ring_positions, eligible)
+        if ring_positions.size:
+            positions.append(ring_positions)
+            distances.append(haversine_km(point, index['lat'][ring_positions], index['lon'][ring_positions]))
+            found += ring_positions.size
+        
+        if last:
+            break
+        
+        # Anything in a later ring is at least ring * min_cell_km away
+        if found >= k:
+            kth = np.partition(np.concatenate(distances), k - 1)[k - 1]
+            if kth <= ring * index['min_cell_km']:
+                break
+    
+    if not positions:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    
+    positions = np.concatenate(positions)
+    distances = np.concatenate(distances)
+    order = np.argsort(distances, kind='stable')[:k]
+    return positions[order], distances[order]
+
+def index_within(index, point, radius_km, eligible=None):
+    """
+    Find all stations within a radius of a point using the spatial index
+    
+    Args:
+        index (dict): Spatial index from build_station_index
+        point (list): [latitude, longitude] of the query
+        radius_km (float): Search radius in kilometers
+        eligible (numpy.ndarray): Optional availability predicate from index_mask
+        
+    Returns:
+        tuple: (positions, distances_km) sorted nearest first
+    """
+    row = int(np.floor(point[0] / index['cell_lat']))
+    col = int(np.floor(point[1] / index['cell_lon']))
+    rings = min(int(np.ceil(radius_km / index['min_cell_km'])), _index_max_ring(index, row, col))
+    
+    if (2 * rings + 1) ** 2 > len(index['cells']):
+        positions = _index_scan(index, row, col, 0, rings)
+    else:
+        positions = np.concatenate(
+            [np.empty(0, dtype=np.int64)] + [_index_ring(index, row, col, ring) for ring in range(rings + 1)]
+        )
+    positions = _index_filter(positions, eligible)
+    distances = haversine_km(point, index['lat'][positions], index['lon'][positions])
+    
+    inside = distances <= radius_km
+    order = np.argsort(distances[inside], kind='stable')
+    return positions[inside][order], distances[inside][order]
+
+def get_station_index(url):
+    """
+    Get the spatial index for the current station_information snapshot
+    
+    The index is only rebuilt when the snapshot itself changes.
+    
+    Args:
+        url (str): API endpoint URL for station information
+        
+    Returns:
+        dict or None: Spatial index, None if station information is unavailable
+    """
+    try:
+        stations = load_station_information_frame(url)
+        cached = _station_indexes.get(url)
+        if cached and cached[0] is stations:
+            return cached[1]
+        
+        index = build_station_index(stations)
+        _station_indexes[url] = (stations, index)
+        return index
+    except (requests.RequestException, KeyError, ValueError):
+        return None
+
+def stations_near_route(user_location, station_location, data, index=None, margin_km=ROUTE_MAP_MARGIN_KM):
+    """
+    Select the stations around a route, for maps that only show its surroundings
+    
+    Args:
+        user_location (list): [latitude, longitude] of user
+        station_location (list): [latitude, longitude] of the chosen station
+        data (pandas.DataFrame): Joined station data
+        index (dict): Optional spatial index from build_station_index
+        margin_km (float): Distance kept around both endpoints
+        
+    Returns:
+        pandas.DataFrame: Rows of data within the circle around the route
+    """
+    center = [(user_location[0] + station_location[0]) / 2, (user_location[1] + station_location[1]) / 2]
+    radius_km = haversine_km(center, np.array([station_location[0]]), np.array([station_location[1]]))[0] + margin_km
+    
+    if index is not None:
+        positions, _ = index_within(index, center, radius_km)
+        return data[data['station_id'].isin(index['station_id'][positions])]
+    
+    distances = haversine_km(center, data['lat'].to_numpy(dtype=np.float64), data['lon'].to_numpy(dtype=np.float64))
+    return data[distances <= radius_km]
+
+def _candidate_stations(user_location, data, mask, k, index=None):
+    """
+    The k stations closest to the user among the rows selected by a mask
+    
+    Candidates come from the spatial index when one is given, otherwise from a
+    vectorized haversine scan.
+    
+    Args:
+        user_location (list): [latitude, longitude] of user
+        data (pandas.DataFrame): Station data
+        mask (pandas.Series): Rows eligible for selection
+        k (int): Number of candidates
+        index (dict): Optional spatial index from get_station_index
+        
+    Returns:
+        tuple: (station_ids, lats, lons, distances_km) sorted nearest first
+    """
+    if index is not None:
+        eligible = index_mask(index, data, mask)
+        positions, distances = index_nearest(index, user_location, k=k, eligible=eligible)
+        return index['station_id'][positions], index['lat'][positions], index['lon'][positions], distances
+    
+    rows = np.flatnonzero(mask.to_numpy())
+    distances = haversine_km(user_location, data['lat'].to_numpy()[rows], data['lon'].to_numpy()[rows])
+    if rows.size > k:
+        nearest = np.argpartition(distances, k - 1)[:k]
+        rows, distances = rows[nearest], distances[nearest]
+    
+    order = np.argsort(distances, kind='stable')
+    rows, distances = rows[order], distances[order]
+    return (
+        data['station_id'].to_numpy()[rows],
+        data['lat'].to_numpy()[rows],
+        data['lon'].to_numpy()[rows],
+        distances
+    )
+
+def _nearest_station(user_location, data, mask, index=None, rerank_k=GEODESIC_RERANK_K):
+    """
+    Pick the nearest station among the rows selected by a boolean mask
+    
+    The closest rerank_k haversine candidates are re-ranked with the exact
+    geodesic distance.
+    
+    Args:
+        user_location (list): [latitude, longitude] of user
+        data (pandas.DataFrame): Station data
+        mask (pandas.Series): Rows eligible for selection
+        index (dict): Optional spatial index from get_station_index
+        rerank_k (int): Candidates to re-rank exactly, 0 to skip
+        
+    Returns:
+        list or None: [station_id, latitude, longitude] of best station, None if no suitable station
+    """
+    station_ids, lats, lons, _ = _candidate_stations(
+        user_location, data, mask, max(rerank_k, 1), index=index
+    )
+    
+    if len(station_ids) == 0:
+        return None
+    
+    best = 0
+    if rerank_k and len(station_ids) > 1:
+        exact = [calculate_distance(user_location, [lat, lon]) for lat, lon in zip(lats, lons)]
+        best = int(np.argmin(exact))
+    
+    return [station_ids[best], lats[best], lons[best]]
+
+def availability_mask(data, mode):
+    """
+    Rows of the station data that can serve a journey mode
+    
+    Args:
+        data (pandas.DataFrame): Station data
+        mode (str): 'any', 'ebike' or 'mechanical' to rent, 'dock' to return
+        
+    Returns:
+        pandas.Series: Boolean mask over the rows of data
+    """
+    if mode == 'ebike':
+        return data['ebike'] > 0
+    elif mode == 'mechanical':
+        return data['mechanical'] > 0
+    elif mode == 'dock':
+        return (data['num_docks_available'] > 0) & (data['is_returning'] == 1)
+    else:
+        return data['num_bikes_available'] > 0
+
+def get_bike_availability(user_location, data, bike_modes, index=None):
+    """
+    Find the nearest station with available bikes matching user preferences
+    
+    Args:
+        user_location (list): [latitude, longitude] of user
+        data (pandas.DataFrame): Station data
+        bike_modes (list): List of preferred bike types ('ebike', 'mechanical')
+        index (dict): Optional spatial index from get_station_index
+        
+    Returns:
+        list or None: [station_id, latitude, longitude] of best station, None if no suitable station
+    """
+    if not bike_modes:
+        bike_modes = ['ebike', 'mechanical']
+    
+    # Filter based on bike type preferences
+    if 'ebike' in bike_modes and 'mechanical' in bike_modes:
+        # User wants any type of bike
+        mask = availability_mask(data, 'any')
+    elif 'ebike' in bike_modes:
+        # User wants only e-bikes
+        mask = availability_mask(data, 'ebike')
+    elif 'mechanical' in bike_modes:
+        # User wants only mechanical bikes
+        mask = availability_mask(data, 'mechanical')
+    else:
+        return None
+    
+    return _nearest_station(user_location, data, mask, index=index)
+
+def get_dock_availability(user_location, data, index=None):
+    """
+    Find the nearest station with available docks for bike return
+    
+    Args:
+        user_location (list): [latitude, longitude] of user
+        data (pandas.DataFrame): Station data
+        index (dict): Optional spatial index from get_station_index
+        
+    Returns:
+        list or None: [station_id, latitude, longitude] of best station, None if no suitable station
+    """
+    # Stations with available docks and accepting returns
+    mask = availability_mask(data, 'dock')
+    
+    return _nearest_station(user_location, data, mask, index=index)
+
+def travel_matrix(origins, destinations, profile='walking'):
+    """
+    Travel times from several origins to several destinations in one OSRM table request
+    
+    Args:
+        origins (list): [latitude, longitude] pairs
+        destinations (list): [latitude, longitude] pairs
+        profile (str): 'walking' or 'cycling'
+        
+    Returns:
+        list or None: One row of durations in seconds per origin (None where
+            no route was found), None if the request failed
+    """
+    if not origins or not destinations:
+        return [[] for _ in origins]
+    
+    try:
+        # Format coordinates for OSRM (longitude,latitude), origins first
+        points = list(origins) + list(destinations)
+        coords = ";".join(f"{lon},{lat}" for lat, lon in points)
+        sources = ";".join(str(i) for i in range(len(origins)))
+        targets = ";".join(str(i) for i in range(len(origins), len(points)))
+        request_url = f"{OSRM_BASE_URL}/table/v1/{profile}/{coords}?sources={sources}&destinations={targets}&annotations=duration"
+        
+        response = http_get(request_url, timeout=10)
+        response.raise_for_status()
+        
+        table = response.json()
+        if table['code'] == 'Ok':
+            return table['durations']
+        
+    except (requests.RequestException, KeyError, IndexError, ValueError):
+        pass
+    
+    # OSRM unavailable: use the local street graph if one is installed
+    rows = [_graph_durations(origin, destinations, profile) for origin in origins]
+    return None if any(row is None for row in rows) else rows
+
+def walking_durations(user_location, destinations):
+    """
+    Walking times from the user to several destinations in one OSRM table request
+    
+    Args:
+        user_location (list): [latitude, longitude] of user
+        destinations (list): [latitude, longitude] pairs
+        
+    Returns:
+        list or None: Duration in seconds per destination (None where OSRM
+            found no route), None if the request failed
+    """
+    if not destinations:
+        return []
+    
+    durations = travel_matrix([user_location], destinations, 'walking')
+    return durations[0] if durations else None
+
+def format_duration(duration_seconds):
+    """
+    Format a walking duration for display
+    
+    Args:
+        duration_seconds (float): Duration in seconds, None if unknown
+        
+    Returns:
+        str: Duration such as "7 min", "< 1 min" or "N/A"
+    """
+    if duration_seconds is None:
+        return "N/A"
+    
+    duration_minutes = int(duration_seconds / 60)
+    if duration_minutes < 1:
+        return "< 1 min"
+    return f"{duration_minutes} min"
+
+def availability_probability(expected, spread):
+    """
+    Probability that a forecast count is at least one
+    
+    Uses a normal approximation with continuity correction; the normal CDF
+    is approximated by a logistic curve (within 0.01), as NumPy has no erf.
+    
+    Args:
+        expected (numpy.ndarray): Expected counts from predict_availability
+        spread (numpy.ndarray): Their standard deviations
+        
+    Returns:
+        numpy.ndarray: Probabilities, NaN where the forecast is unknown
+    """
+    z = (np.asarray(expected, dtype=np.float64) - 0.5) / np.maximum(spread, FORECAST_MIN_SPREAD)
+    return 1 / (1 + np.exp(-1.702 * z))
+
+def score_candidates(candidates, mode, now=None, deadline=None):
+    """
+    Rank station candidates by the expected time to get a bike (or dock)
+    
+    Each candidate costs its walking time plus MISSED_STATION_PENALTY
+    weighted by the chance it has run out by the time the user arrives, so a
+    slightly longer walk to a well-stocked station beats a near one with a
+    single bike. All candidates are forecast in one batch.
+    
+    Args:
+        candidates (list): Dicts with 'station_id', 'distance_km' and
+            'walk_seconds' (None when unknown), as from nearest_stations
+        mode (str): 'any', 'ebike' or 'mechanical' to rent, 'dock' to return
+        now (float): Current time, defaults to time.time()
+        deadline (float): time.monotonic() by which to finish; once it has
+            passed the forecast is skipped and candidates are ranked by
+            walking time alone
+        
+    Returns:
+        list: The candidates, best first, with 'predicted' (count forecast on
+            arrival), 'probability' (that it is still available) and
+            'score_seconds' set; forecasts are None when unknown or skipped
+    """
+    if not candidates:
+        return candidates
+    
+    # Arrival times, with a straight-line estimate where routing failed
+    walk = np.array([
+        c['walk_seconds'] if c['walk_seconds'] is not None else c['distance_km'] * 1000 / TRAVEL_SPEED_MPS['walking']
+        for c in candidates
+    ], dtype=np.float64)
+    
+    column = MODE_COUNTS.get(mode, MODE_COUNTS['any'])
+    if deadline is None or time.monotonic() < deadline:
+        forecast = predict_availability([c['station_id'] for c in candidates], walk / 60, now=now)
+        expected = forecast[column]
+        probability = availability_probability(expected, forecast[f"{column}_std"])
+    else:
+        # Out of time: no penalty, so the walking times decide
+        expected = probability = np.full(len(candidates), np.nan)
+    score = walk + np.where(np.isnan(probability), 0, 1 - probability) * MISSED_STATION_PENALTY
+    
+    for candidate, predicted, chance, seconds in zip(candidates, expected, probability, score):
+        candidate['predicted'] = None if np.isnan(predicted) else float(predicted)
+        candidate['probability'] = None if np.isnan(chance) else float(chance)
+        candidate['score_seconds'] = float(seconds)
+    
+    # Unroutable stations go last, keeping straight-line order among ties
+    candidates.sort(key=lambda c: (c['walk_seconds'] is None, c['score_seconds']))
+    return candidates
+
+def nearest_stations(user_location, data, k=3, mode='any', index=None, pool=STATION_SCORE_POOL):
+    """
+    Find the k best stations for a journey, ranked by expected time
+    
+    The pool closest eligible stations are picked cheaply from the
+    coordinates, their walking durations come from a single batched OSRM
+    table request, and score_candidates weighs each walk against the
+    forecast chance the station still has a bike (or dock) on arrival. If
+    routing is unavailable the walks are estimated from the straight-line
+    distance. The local work is held to STATION_SCORE_BUDGET (the routing
+    request is not counted); past it the forecast is skipped.
+    
+    Args:
+        user_location (list): [latitude, longitude] of user
+        data (pandas.DataFrame): Station data
+        k (int): Number of candidates to return
+        mode (str): 'any', 'ebike' or 'mechanical' to rent, 'dock' to return
+        index (dict): Optional spatial index from get_station_index
+        pool (int): Number of nearby stations to score
+        
+    Returns:
+        list: Candidate dicts with 'station_id', 'lat', 'lon', 'distance_km',
+            'walk_seconds', 'predicted', 'probability' and 'score_seconds'
+            (see score_candidates), best first
+    """
+    started = time.monotonic()
+    station_ids, lats, lons, distances = _candidate_stations(
+        user_location, data, availability_mask(data, mode), max(k, pool), index=index
+    )
+    
+    candidates = [
+        {
+            'station_id': station_id,
+            'lat': lat,
+            'lon': lon,
+            'distance_km': float(distance),
+            'walk_seconds': None
+        }
+        for station_id, lat, lon, distance in zip(station_ids, lats, lons, distances)
+    ]
+    spent = time.monotonic() - started
+    
+    durations = walking_durations(user_location, [[c['lat'], c['lon']] for c in candidates])
+    if durations:
+        for candidate, duration in zip(candidates, durations):
+            candidate['walk_seconds'] = duration
+    
+    deadline = time.monotonic() + STATION_SCORE_BUDGET - spent
+    return score_candidates(candidates, mode, deadline=deadline)[:k]
+
+def _osrm_route(origin, destination, profile):
+    """
+    Routing backend using an OSRM server (OSRM_BASE_URL)
+    
+    Args:
+        origin (list): [latitude, longitude] of the start
+        destination (list): [latitude, longitude] of the end
+        profile (str): OSRM profile, 'walking' or 'cycling'
+        
+    Returns:
+        dict or None: Route with 'coordinates' ([lat, lon] list) and 'duration' (s)
+    """
+    # Format coordinates for OSRM (longitude,latitude)
+    start_coords = f"{origin[1]},{origin[0]}"
+    end_coords = f"{destination[1]},{destination[0]}"
+    
+    # Build request URL
+    request_url = f"{OSRM_BASE_URL}/route/v1/{profile}/{start_coords};{end_coords}?overview=full&geometries=geojson"
+    
+    response = http_get(request_url, timeout=10)
+    response.raise_for_status()
+    
+    route_data = response.json()
+    if route_data['code'] != 'Ok' or not route_data['routes']:
+        return None
+    
+    route = route_data['routes'][0]
+    
+    # Extract coordinates (convert from [lon, lat] to [lat, lon])
+    coordinates = [
+        [coord[1], coord[0]] 
+        for coord in route['geometry']['coordinates']
+    ]
+    return {'coordinates': coordinates, 'duration': route['duration']}
+
+def load_street_graph(path=STREET_GRAPH_PATH):
+    """
+    Load the local street graph used by the offline routing backend
+    
+    The file is JSON with 'nodes' as [lat, lon] pairs and 'edges' as
+    [from, to] or [from, to, meters] node index lists (edges are two-way).
+    
+    Args:
+        path (str): Street graph file path
+        
+    Returns:
+        dict or None: Graph with node arrays and adjacency lists, None if missing
+    """
+    global _street_graph
+    
+    with _street_graph_lock:
+        if _street_graph is not None and _street_graph['path'] == path:
+            return _street_graph
+        
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            nodes = np.asarray(raw['nodes'], dtype=np.float64).reshape(-1, 2)
+            edges = raw['edges']
+        except (OSError, KeyError, ValueError):
+            return None
+        
+        ends = np.array([[int(edge[0]), int(edge[1])] for edge in edges], dtype=np.int64).reshape(-1, 2)
+        meters = np.array([float(edge[2]) if len(edge) > 2 else np.nan for edge in edges])
+        
+        # Edges without a length get the straight-line distance between their nodes
+        missing = np.isnan(meters)
+        if missing.any():
+            u, v = ends[missing, 0], ends[missing, 1]
+            meters[missing] = haversine_km((nodes[u, 0], nodes[u, 1]), nodes[v, 0], nodes[v, 1]) * 1000
+        
+        adjacency = [[] for _ in range(len(nodes))]
+        for (u, v), length in zip(ends.tolist(), meters.tolist()):
+            adjacency[u].append((v, length))
+            adjacency[v].append((u, length))
+        
+        _street_graph = {'path': path, 'nodes': nodes, 'adjacency': adjacency}
+        return _street_graph
+
+def _graph_snap(graph, point):
+    """Index of the street graph node closest to a point"""
+    return int(np.argmin(haversine_km(point, graph['nodes'][:, 0], graph['nodes'][:, 1])))
+
+def _graph_shortest_paths(graph, source, targets):
+    """
+    Dijkstra from one node until all target nodes are settled
+    
+    Args:
+        graph (dict): Street graph from load_street_graph
+        source (int): Start node
+        targets (set): Nodes to reach
+        
+    Returns:
+        tuple: (distances, previous) dicts keyed by node
+    """
+    distances = {source: 0.0}
+    previous = {}
+    remaining = set(targets)
+    queue = [(0.0, source)]
+    
+    while queue and remaining:
+        distance, node = heapq.heappop(queue)
+        if distance > distances.get(node, float('inf')):
+            continue
+        remaining.discard(node)
+        
+        for neighbor, meters in graph['adjacency'][node]:
+            candidate = distance + meters
+            if candidate < distances.get(neighbor, float('inf')):
+                distances[neighbor] = candidate
+                previous[neighbor] = node
+                heapq.heappush(queue, (candidate, neighbor))
+    
+    return distances, previous
+
+def _graph_route(origin, destination, profile):
+    """
+    Routing backend over the local street graph (see load_street_graph)
+    
+    Args:
+        origin (list): [latitude, longitude] of the start
+        destination (list): [latitude, longitude] of the end
+        profile (str): 'walking' or 'cycling', sets the travel speed
+        
+    Returns:
+        dict or None: Route with 'coordinates' ([lat, lon] list) and 'duration' (s)
+    """
+    graph = load_street_graph()
+    if graph is None or len(graph['nodes']) == 0:
+        return None
+    
+    source = _graph_snap(graph, origin)
+    target = _graph_snap(graph, destination)
+    distances, previous = _graph_shortest_paths(graph, source, {target})
+    if target not in distances:
+        return None
+    
+    path = [target]
+    while path[-1] != source:
+        path.append(previous[path[-1]])
+    path.reverse()
+    
+    coordinates = [list(origin)] + [graph['nodes'][node].tolist() for node in path] + [list(destination)]
+    return {
+        'coordinates': coordinates,
+        'duration': distances[target] / TRAVEL_SPEED_MPS.get(profile, TRAVEL_SPEED_MPS['walking'])
+    }
+
+def _graph_durations(origin, destinations, profile):
+    """
+    Travel times from one point to several over the local street graph
+    
+    Args:
+        origin (list): [latitude, longitude] of the start
+        destinations (list): [latitude, longitude] pairs
+        profile (str): 'walking' or 'cycling', sets the travel speed
+        
+    Returns:
+        list or None: Duration in seconds per destination (None if unreachable),
+            None if no street graph is installed
+    """
+    graph = load_street_graph()
+    if graph is None or len(graph['nodes']) == 0:
+        return None
+    
+    source = _graph_snap(graph, origin)
+    targets = [_graph_snap(graph, destination) for destination in destinations]
+    distances, _ = _graph_shortest_paths(graph, source, set(targets))
+    
+    speed = TRAVEL_SPEED_MPS.get(profile, TRAVEL_SPEED_MPS['walking'])
+    return [distances[target] / speed if target in distances else None for target in targets]
+
+# Routing backends by name; add to this dict to plug in another router
+routing_backends = {
+    'osrm': _osrm_route,
+    'graph': _graph_route
+}
+
+def _route_cell(point, cell_m=ROUTE_CACHE_CELL_M):
+    """Snap a point to a grid cell of cell_m metres"""
+    step = cell_m / 1000 / KM_PER_DEGREE_LAT
+    return (
+        int(round(point[0] / step)),
+        int(round(point[1] * np.cos(np.radians(point[0])) / step))
+    )
+
+def get_route(origin, destination, profile='walking'):
+    """
+    Route between two points through the route cache and routing backends
+    
+    Origins and destinations are snapped to ROUTE_CACHE_CELL_M cells, so
+    repeated and nearby requests are served from the cache. Backends in
+    ROUTING_BACKENDS are tried in order until one returns a route.
     
     Args:
-        url (str): API endpoint URL for station status
+        origin (list): [latitude, longitude] of the start
+        destination (list): [latitude, longitude] of the end
+        profile (str): 'walking' or 'cycling'
         
     Returns:
-        pandas.DataFrame: DataFrame containing station status information
+        dict or None: Route with 'coordinates' ([lat, lon] list) and 'duration'
+            in seconds, None if no backend could route
     """
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        stations = data['data']['stations']
-        
-        # Process station data
-        processed_data = []
-        for station in stations:
-            station_info = {
-                'station_id': station['station_id'],
-                'num_bikes_available': station['num_bikes_available'],
-                'num_docks_available': station['num_docks_available'],
-                'is_installed': station['is_installed'],
-                'is_renting': station['is_renting'],
-                'is_returning': station['is_returning'],
-                'last_reported': station['last_reported']
-            }
-            
-            # Parse vehicle types if available
-            if 'num_bikes_available_types' in station:
-                bike_types = station['num_bikes_available_types']
-                if isinstance(bike_types, dict):
-                    ebike_count = bike_types.get('ebike', 0)
-                    mechanical_count = bike_types.get('mechanical', 0)
-                else:
-                    ebike_count = 0
-                    mechanical_count = station['num_bikes_available']
-                
-                station_info['ebike'] = ebike_count
-                station_info['mechanical'] = mechanical_count
-            elif 'vehicle_types_available' in station:
-                # Fallback for older API format
-                ebike_count = 0
-                mechanical_count = 0
-                
-                for vehicle_type in station['vehicle_types_available']:
-                    if vehicle_type['vehicle_type_id'] == 'ebike':
-                        ebike_count = vehicle_type['count']
-                    elif vehicle_type['vehicle_type_id'] == 'mechanical':
-                        mechanical_count = vehicle_type['count']
-                
-                station_info['ebike'] = ebike_count
-                station_info['mechanical'] = mechanical_count
-            else:
-                # Fallback if no vehicle type data available
-                station_info['ebike'] = 0
-                station_info['mechanical'] = station['num_bikes_available']
-            
-            processed_data.append(station_info)
-        
-        return pd.DataFrame(processed_data)
-        
-    except requests.RequestException as e:
-        st.error(f"Error fetching station status: {str(e)}")
-        return pd.DataFrame()
-    except (KeyError, json.JSONDecodeError) as e:
-        st.error(f"Error parsing station status data: {str(e)}")
-        return pd.DataFrame()
+    key = (profile, _route_cell(origin), _route_cell(destination))
+    with _route_cache_lock:
+        route = _route_cache.get(key)
+        if route is not None:
+            _route_cache.move_to_end(key)
+            return route
+    
+    route = None
+    errors = []
+    for name in ROUTING_BACKENDS:
+        backend = routing_backends.get(name)
+        if backend is None:
+            continue
+        try:
+            route = backend(origin, destination, profile)
+        except (requests.RequestException, KeyError, IndexError, ValueError) as e:
+            errors.append(f"{name}: {e}")
+            continue
+        if route is not None:
+            break
+    
+    if route is None:
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return None
+    
+    with _route_cache_lock:
+        _route_cache[key] = route
+        while len(_route_cache) > ROUTE_CACHE_SIZE:
+            _route_cache.popitem(last=False)
+    return route
 
-def get_station_latlon(url):
+def run_osrm(station_coords, user_location):
     """
-    Fetch station location data from the Toronto Bike Share API
+    Get route coordinates and walking duration for a station
+    
+    Served from the route cache when possible, otherwise from the configured
+    routing backends (OSRM, then the local street graph).
     
     Args:
-        url (str): API endpoint URL for station information
+        station_coords (list): [station_id, latitude, longitude] of destination
+        user_location (list): [latitude, longitude] of user
         
     Returns:
-        pandas.DataFrame: DataFrame containing station location information
+        tuple: (coordinates_list, duration_string)
     """
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        stations = data['data']['stations']
-        
-        # Process location data
-        location_data = []
-        for station in stations:
-            location_info = {
-                'station_id': station['station_id'],
-                'name': station['name'],
-                'lat': station['lat'],
-                'lon': station['lon'],
-                'capacity': station['capacity']
-            }
-            location_data.append(location_info)
+        route = get_route(user_location, [station_coords[1], station_coords[2]], 'walking')
         
-        return pd.DataFrame(location_data)
+        if route:
+            return route['coordinates'], format_duration(route['duration'])
+        else:
+            # Fallback: return straight line
+            return [user_location, [station_coords[1], station_coords[2]]], "N/A"
+            
+    except Exception as e:
+        st.warning(f"Could not calculate route: {str(e)}")
+        # Fallback: return straight line between points
+        return [user_location, [station_coords[1], station_coords[2]]], "N/A"
+
+def submit_job(fn, *args, deadline=None, executor=None, **kwargs):
+    """
+    Run a slow call on the shared job pool
+    
+    Args:
+        fn (callable): Function to run
+        *args: Positional arguments for fn
+        deadline (float): Seconds the result is worth waiting for, None for no limit
+        executor (ThreadPoolExecutor): Pool to run on, the shared job pool by default
+        **kwargs: Keyword arguments for fn
         
-    except requests.RequestException as e:
-        st.error(f"Error fetching station locations: {str(e)}")
-        return pd.DataFrame()
-    except (KeyError, json.JSONDecodeError) as e:
-        st.error(f"Error parsing station location data: {str(e)}")
-        return pd.DataFrame()
+    Returns:
+        dict: Job handle for job_result and cancel_job
+    """
+    executor = executor or _job_executor
+    return {
+        'future': executor.submit(fn, *args, **kwargs),
+        'deadline': time.monotonic() + deadline if deadline is not None else None,
+        'cancelled': False
+    }
 
-def join_latlon(status_df, location_df):
+def job_result(job, timeout=0):
     """
-    Join station status data with location data
+    Check a job, waiting up to timeout seconds (and never past its deadline)
     
     Args:
-        status_df (pandas.DataFrame): Station status data
-        location_df (pandas.DataFrame): Station location data
+        job (dict): Handle from submit_job
+        timeout (float): Longest time to wait for the result
         
     Returns:
-        pandas.DataFrame: Combined DataFrame with status and location data
+        tuple: (status, value) where status is 'done', 'pending', 'failed'
+            (value is the exception), 'expired' or 'cancelled'
     """
-    if status_df.empty or location_df.empty:
-        return pd.DataFrame()
+    if job['cancelled']:
+        return 'cancelled', None
     
-    # Merge on station_id
-    merged_df = pd.merge(status_df, location_df, on='station_id', how='inner')
+    future = job['future']
+    if not future.done():
+        wait = timeout
+        if job['deadline'] is not None:
+            wait = min(wait, job['deadline'] - time.monotonic())
+        if wait > 0:
+            try:
+                future.exception(timeout=wait)
+            except FutureTimeoutError:
+                pass
+        
+        if not future.done():
+            if job['deadline'] is not None and time.monotonic() >= job['deadline']:
+                return 'expired', None
+            return 'pending', None
     
-    # Filter for active stations only
-    active_stations = merged_df[
-        (merged_df['is_installed'] == 1) & 
-        (merged_df['is_renting'] == 1)
-    ].copy()
+    error = future.exception()
+    if error is not None:
+        return 'failed', error
+    return 'done', future.result()
+
+def cancel_job(job):
+    """
+    Cancel a job; a call that already started runs on but its result is dropped
     
-    return active_stations
+    Args:
+        job (dict): Handle from submit_job
+    """
+    job['cancelled'] = True
+    job['future'].cancel()
 
-def geocode(address):
+def start_journey(address, mode, k=3):
     """
-    Convert an address to latitude and longitude coordinates
+    Start a nearest-station request in the background
+    
+    The request goes through geocoding, station ranking and routing; advance
+    it with poll_journey.
     
     Args:
-        address (str): Street address to geocode
+        address (str): Address to geocode
+        mode (str): Availability mode for nearest_stations
+        k (int): Number of candidate stations
         
     Returns:
-        list or str: [latitude, longitude] if successful, empty string if failed
+        dict: Journey with the 'location', 'candidates' and 'route' found so
+            far (None while pending, route is False if it could not be
+            computed) and an 'error' of 'address' or 'stations' if it failed
     """
-    try:
-        geolocator = Nominatim(user_agent="toronto_bikeshare_app")
-        location = geolocator.geocode(address, timeout=10)
+    return {
+        'address': address,
+        'mode': mode,
+        'k': k,
+        'jobs': {'geocode': submit_job(geocode, address, deadline=GEOCODE_DEADLINE, executor=_geocode_executor)},
+        'location': None,
+        'candidates': None,
+        'route': None,
+        'error': None
+    }
+
+def journey_pending(journey):
+    """Whether a journey is still waiting on a background job"""
+    if journey['error'] is not None:
+        return False
+    if journey['candidates'] is None:
+        return True
+    return bool(journey['candidates']) and journey['route'] is None
+
+def poll_journey(journey, data, index=None, wait=0.0):
+    """
+    Advance a journey with whatever its background jobs have finished
+    
+    Each finished stage submits the next one, so the nearest stations are
+    known before the route is.
+    
+    Args:
+        journey (dict): Journey from start_journey
+        data (pandas.DataFrame): Joined station data
+        index (dict): Optional spatial index from build_station_index
+        wait (float): Longest total time to wait for pending jobs
         
-        if location:
-            return [location.latitude, location.longitude]
-        else:
-            return ''
-            
-    except Exception as e:
-        st.error(f"Geocoding error: {str(e)}")
-        return ''
+    Returns:
+        bool: True while the journey is still pending
+    """
+    give_up = time.monotonic() + wait
+    jobs = journey['jobs']
+    
+    if journey['error'] is not None:
+        return False
+    
+    if journey['location'] is None:
+        status, location = job_result(jobs['geocode'], give_up - time.monotonic())
+        if status == 'pending':
+            return True
+        if status != 'done' or not location:
+            journey['error'] = 'address'
+            return False
+        
+        journey['location'] = location
+        jobs['stations'] = submit_job(
+            nearest_stations, location, data, journey['k'], journey['mode'], index,
+            deadline=STATIONS_DEADLINE
+        )
+    
+    if journey['candidates'] is None:
+        status, candidates = job_result(jobs['stations'], give_up - time.monotonic())
+        if status == 'pending':
+            return True
+        if status != 'done':
+            journey['error'] = 'stations'
+            return False
+        
+        journey['candidates'] = candidates
+        if not candidates:
+            return False
+        
+        best = candidates[0]
+        jobs['route'] = submit_job(
+            get_route, journey['location'], [best['lat'], best['lon']], 'walking',
+            deadline=ROUTE_DEADLINE
+        )
+    
+    if journey['route'] is None and journey['candidates']:
+        status, route = job_result(jobs['route'], give_up - time.monotonic())
+        if status == 'pending':
+            return True
+        journey['route'] = route if status == 'done' and route else False
+    
+    return False
 
-def get_marker_color(num_bikes):
+def cancel_journey(journey):
     """
-    Determine marker color based on number of available bikes
+    Cancel the background jobs of a journey the user no longer wants
     
     Args:
-        num_bikes (int): Number of available bikes at station
+        journey (dict): Journey from start_journey
+    """
+    for job in journey['jobs'].values():
+        cancel_job(job)
+
+def fail_journey(journey, message):
+    """
+    Stop a journey or trip that could not be shown, keeping the reason
+    
+    The jobs are cancelled and the error is recorded, so the request is no
+    longer pending and the next run shows the message instead of polling.
+    
+    Args:
+        journey (dict): Journey from start_journey or trip from start_trip
+        message (str): What went wrong
+    """
+    journey['error'] = message
+    cancel_journey(journey)
+
+def _estimated_durations(origins, destinations, profile):
+    """Straight-line travel times (seconds) as an origins x destinations array"""
+    speed = TRAVEL_SPEED_MPS.get(profile, TRAVEL_SPEED_MPS['walking'])
+    destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+    return np.array([
+        haversine_km(origin, destinations[:, 0], destinations[:, 1]) * 1000 / speed
+        for origin in origins
+    ]).reshape(len(origins), len(destinations))
+
+def _trip_durations(origins, destinations, profile, future):
+    """A travel_matrix result as an array, straight-line estimates where routing failed"""
+    estimate = _estimated_durations(origins, destinations, profile)
+    durations = future.result()
+    if not durations:
+        return estimate
+    
+    durations = np.array(durations, dtype=np.float64)
+    return np.where(np.isnan(durations), estimate, durations)
+
+def plan_trip(origin, destination, data, index=None, mode='any', k=TRIP_CANDIDATES, now=None):
+    """
+    Plan a rent-then-return trip: walk to a pickup station, ride, walk from a dock
+    
+    Only the k nearest stations with a bike around the origin and with a dock
+    around the destination are considered, so routing takes one walking
+    request at each end and a single k x k cycling matrix, sent side by side.
+    Each pickup/dock pair costs its walk + ride + walk time plus
+    MISSED_STATION_PENALTY weighted by the forecast chance that the pickup
+    has no bike, or the dock no space, by the time the rider gets there.
+    Plans are cached for TRIP_CACHE_TTL seconds per pair of
+    TRIP_CACHE_CELL_M cells.
+    
+    Args:
+        origin (list): [latitude, longitude] of the start
+        destination (list): [latitude, longitude] of the end
+        data (pandas.DataFrame): Station data
+        index (dict): Optional spatial index from get_station_index
+        mode (str): 'any', 'ebike' or 'mechanical' bike to rent
+        k (int): Candidate stations at each end
+        now (float): Current time, defaults to time.time()
         
     Returns:
-        str: Color code for the marker
+        dict or None: Plan with 'pickup' and 'dropoff' station dicts
+            ('station_id', 'lat', 'lon', 'probability'), 'walk_to_seconds',
+            'ride_seconds', 'walk_from_seconds', 'total_seconds' and
+            'probability' (of both stations working out); None if there is no
+            pair of distinct stations
     """
-    if num_bikes >= 5:
-        return 'green'
-    elif num_bikes >= 1:
-        return 'orange'
-    else:
-        return 'red'
+    now = now or time.time()
+    key = (mode, _route_cell(origin, TRIP_CACHE_CELL_M), _route_cell(destination, TRIP_CACHE_CELL_M))
+    with _trip_cache_lock:
+        cached = _trip_cache.get(key)
+        if cached is not None and now - cached[0] < TRIP_CACHE_TTL:
+            _trip_cache.move_to_end(key)
+            return cached[1]
+    
+    pick_ids, pick_lats, pick_lons, _ = _candidate_stations(
+        origin, data, availability_mask(data, mode), k, index=index
+    )
+    dock_ids, dock_lats, dock_lons, _ = _candidate_stations(
+        destination, data, availability_mask(data, 'dock'), k, index=index
+    )
+    
+    plan = None
+    if len(pick_ids) and len(dock_ids):
+        pickups = [[lat, lon] for lat, lon in zip(pick_lats, pick_lons)]
+        docks = [[lat, lon] for lat, lon in zip(dock_lats, dock_lons)]
+        
+        # The three tables are independent, fetch them at the same time
+        walk_to = _fetch_executor.submit(travel_matrix, [origin], pickups, 'walking')
+        ride = _fetch_executor.submit(travel_matrix, pickups, docks, 'cycling')
+        walk_from = _fetch_executor.submit(travel_matrix, docks, [destination], 'walking')
+        walk_to = _trip_durations([origin], pickups, 'walking', walk_to)[0]
+        ride = _trip_durations(pickups, docks, 'cycling', ride)
+        walk_from = _trip_durations(docks, [destination], 'walking', walk_from)[:, 0]
+        
+        # Chance of a bike at each pickup, and of a space at each dock given the pickup
+        column = MODE_COUNTS.get(mode, MODE_COUNTS['any'])
+        forecast = predict_availability(pick_ids, walk_to / 60, now=now)
+        pick_chance = availability_probability(forecast[column], forecast[f"{column}_std"])
+        arrival = (walk_to[:, None] + ride) / 60
+        forecast = predict_availability(np.tile(dock_ids, len(pick_ids)), arrival.ravel(), now=now)
+        dock_chance = availability_probability(
+            forecast['num_docks_available'], forecast['num_docks_available_std']
+        ).reshape(arrival.shape)
+        
+        total = walk_to[:, None] + ride + walk_from[None, :]
+        risk = 1 - np.nan_to_num(pick_chance, nan=1.0)[:, None] * np.nan_to_num(dock_chance, nan=1.0)
+        score = total + risk * MISSED_STATION_PENALTY
+        score[np.asarray(pick_ids, dtype=object)[:, None] == np.asarray(dock_ids, dtype=object)[None, :]] = np.inf
+        
+        best = np.unravel_index(np.argmin(score), score.shape)
+        if np.isfinite(score[best]):
+            i, j = best
+            probability = pick_chance[i] * dock_chance[i, j]
+            plan = {
+                'pickup': {
+                    'station_id': pick_ids[i],
+                    'lat': float(pick_lats[i]),
+                    'lon': float(pick_lons[i]),
+                    'probability': None if np.isnan(pick_chance[i]) else float(pick_chance[i])
+                },
+                'dropoff': {
+                    'station_id': dock_ids[j],
+                    'lat': float(dock_lats[j]),
+                    'lon': float(dock_lons[j]),
+                    'probability': None if np.isnan(dock_chance[i, j]) else float(dock_chance[i, j])
+                },
+                'walk_to_seconds': float(walk_to[i]),
+                'ride_seconds': float(ride[i, j]),
+                'walk_from_seconds': float(walk_from[j]),
+                'total_seconds': float(total[i, j]),
+                'probability': None if np.isnan(probability) else float(probability)
+            }
+    
+    with _trip_cache_lock:
+        _trip_cache[key] = (now, plan)
+        while len(_trip_cache) > TRIP_CACHE_SIZE:
+            _trip_cache.popitem(last=False)
+    return plan
 
-def calculate_distance(point1, point2):
+def start_trip(origin_address, destination_address, mode='any'):
     """
-    Calculate distance between two geographic points
+    Start a trip plan in the background
+    
+    Both addresses are geocoded at once, then the plan and the three legs'
+    routes follow; advance it with poll_trip and cancel it with
+    cancel_journey.
     
     Args:
-        point1 (list): [latitude, longitude] of first point
-        point2 (list): [latitude, longitude] of second point
+        origin_address (str): Address to start from
+        destination_address (str): Address to go to
+        mode (str): 'any', 'ebike' or 'mechanical' bike to rent
         
     Returns:
-        float: Distance in kilometers
+        dict: Trip with the 'origin', 'destination', 'plan' and 'routes'
+            found so far (None while pending, plan is False if no stations
+            fit) and an 'error' of 'origin', 'destination' or 'stations' if
+            it failed
     """
-    return geodesic(point1, point2).kilometers
+    return {
+        'address': origin_address,
+        'destination_address': destination_address,
+        'mode': mode,
+        'jobs': {
+            'origin': submit_job(geocode, origin_address, deadline=GEOCODE_DEADLINE, executor=_geocode_executor),
+            'destination': submit_job(geocode, destination_address, deadline=GEOCODE_DEADLINE, executor=_geocode_executor)
+        },
+        'origin': None,
+        'destination': None,
+        'plan': None,
+        'routes': None,
+        'error': None
+    }
+
+def trip_pending(trip):
+    """Whether a trip is still waiting on a background job"""
+    if trip['error'] is not None or trip['plan'] is False:
+        return False
+    return trip['plan'] is None or trip['routes'] is None
 
-def get_bike_availability(user_location, data, bike_modes):
+def poll_trip(trip, data, index=None, wait=0.0):
     """
-    Find the nearest station with available bikes matching user preferences
+    Advance a trip with whatever its background jobs have finished
     
     Args:
-        user_location (list): [latitude, longitude] of user
-        data (pandas.DataFrame): Station data
-        bike_modes (list): List of preferred bike types ('ebike', 'mechanical')
+        trip (dict): Trip from start_trip
+        data (pandas.DataFrame): Joined station data
+        index (dict): Optional spatial index from build_station_index
+        wait (float): Longest total time to wait for pending jobs
         
     Returns:
-        list or None: [station_id, latitude, longitude] of best station, None if no suitable station
+        bool: True while the trip is still pending
     """
-    if not bike_modes:
-        bike_modes = ['ebike', 'mechanical']
+    give_up = time.monotonic() + wait
+    jobs = trip['jobs']
     
-    # Filter stations based on bike availability and preferences
-    available_stations = data.copy()
+    if trip['error'] is not None:
+        return False
     
-    # Filter based on bike type preferences
-    if 'ebike' in bike_modes and 'mechanical' in bike_modes:
-        # User wants any type of bike
-        available_stations = available_stations[available_stations['num_bikes_available'] > 0]
-    elif 'ebike' in bike_modes:
-        # User wants only e-bikes
-        available_stations = available_stations[available_stations['ebike'] > 0]
-    elif 'mechanical' in bike_modes:
-        # User wants only mechanical bikes
-        available_stations = available_stations[available_stations['mechanical'] > 0]
-    else:
-        return None
+    for end in ('origin', 'destination'):
+        if trip[end] is None:
+            status, location = job_result(jobs[end], give_up - time.monotonic())
+            if status == 'pending':
+                return True
+            if status != 'done' or not location:
+                trip['error'] = end
+                return False
+            trip[end] = location
     
-    if available_stations.empty:
-        return None
+    if 'plan' not in jobs:
+        jobs['plan'] = submit_job(
+            plan_trip, trip['origin'], trip['destination'], data, index, trip['mode'],
+            deadline=TRIP_DEADLINE
+        )
     
-    # Calculate distances and find nearest station
-    available_stations = available_stations.copy()
-    available_stations['distance'] = available_stations.apply(
-        lambda row: calculate_distance(user_location, [row['lat'], row['lon']]), 
-        axis=1
-    )
+    if trip['plan'] is None:
+        status, plan = job_result(jobs['plan'], give_up - time.monotonic())
+        if status == 'pending':
+            return True
+        if status != 'done':
+            trip['error'] = 'stations'
+            return False
+        
+        trip['plan'] = plan or False
+        if not plan:
+            return False
+        
+        pickup = [plan['pickup']['lat'], plan['pickup']['lon']]
+        dropoff = [plan['dropoff']['lat'], plan['dropoff']['lon']]
+        for leg, origin, destination, profile in (
+            ('walk_to', trip['origin'], pickup, 'walking'),
+            ('ride', pickup, dropoff, 'cycling'),
+            ('walk_from', dropoff, trip['destination'], 'walking')
+        ):
+            jobs[leg] = submit_job(get_route, origin, destination, profile, deadline=ROUTE_DEADLINE)
     
-    # Sort by distance and get the nearest station
-    nearest_station = available_stations.loc[available_stations['distance'].idxmin()]
+    if trip['routes'] is None:
+        routes = {}
+        for leg in ('walk_to', 'ride', 'walk_from'):
+            status, route = job_result(jobs[leg], give_up - time.monotonic())
+            if status == 'pending':
+                return True
+            routes[leg] = route if status == 'done' and route else False
+        trip['routes'] = routes
     
-    return [nearest_station['station_id'], nearest_station['lat'], nearest_station['lon']]
+    return False
 
-def get_dock_availability(user_location, data):
+def station_features(data):
     """
-    Find the nearest station with available docks for bike return
+    Convert station data to a GeoJSON FeatureCollection for a single map layer
     
     Args:
-        user_location (list): [latitude, longitude] of user
-        data (pandas.DataFrame): Station data
+        data (pandas.DataFrame): Joined station data
         
     Returns:
-        list or None: [station_id, latitude, longitude] of best station, None if no suitable station
+        dict: FeatureCollection of station points; counts, name and marker
+            'color' are feature properties
     """
-    # Filter stations with available docks and accepting returns
-    available_stations = data[
-        (data['num_docks_available'] > 0) & 
-        (data['is_returning'] == 1)
-    ].copy()
+    bikes = data['num_bikes_available'].to_numpy()
     
-    if available_stations.empty:
-        return None
+    # Vectorized get_marker_color
+    colors = np.select([bikes >= 5, bikes >= 1], ['green', 'orange'], 'red')
+    names = data['name'] if 'name' in data.columns else data['station_id']
     
-    # Calculate distances and find nearest station
-    available_stations['distance'] = available_stations.apply(
-        lambda row: calculate_distance(user_location, [row['lat'], row['lon']]), 
-        axis=1
+    # Six decimals (~0.1 m) keeps float32 noise out of the payload
+    lons = np.round(data['lon'].to_numpy(dtype=np.float64), 6).tolist()
+    lats = np.round(data['lat'].to_numpy(dtype=np.float64), 6).tolist()
+    
+    columns = zip(
+        data['station_id'].astype(str).tolist(), names.astype(str).tolist(),
+        lons, lats, bikes.tolist(), data['ebike'].tolist(), data['mechanical'].tolist(),
+        data['num_docks_available'].tolist(), colors.tolist()
     )
     
-    # Sort by distance and get the nearest station
-    nearest_station = available_stations.loc[available_stations['distance'].idxmin()]
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {
+                'station_id': station_id,
+                'name': name,
+                'num_bikes_available': num_bikes,
+                'ebike': ebike,
+                'mechanical': mechanical,
+                'num_docks_available': num_docks,
+                'color': color
+            }
+        }
+        for station_id, name, lon, lat, num_bikes, ebike, mechanical, num_docks, color in columns
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+def _station_style(feature):
+    """Marker style for a station feature"""
+    color = feature['properties']['color']
+    return {'color': color, 'fillColor': color}
+
+def _popup_binding(template, max_width=300):
+    """
+    JavaScript that binds a popup rendered from a template on click
     
-    return [nearest_station['station_id'], nearest_station['lat'], nearest_station['lon']]
+    The template uses {field} placeholders for feature properties and is
+    shipped to the browser once for the whole layer.
+    """
+    if template is None:
+        return ''
+    return """
+                var template = %s;
+                layer.bindPopup(function(layer) {
+                    var properties = layer.feature.properties;
+                    return template.replace(/\\{(\\w+)\\}/g, function(match, field) {
+                        var value = properties[field] === undefined ? 'N/A' : String(properties[field]);
+                        return value.replace(/[&<>"']/g, function(c) {
+                            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                        });
+                    });
+                }, {maxWidth: %d});""" % (json.dumps(template), max_width)
 
-def run_osrm(station_coords, user_location):
+def station_layer(data, radius=3, fill_opacity=0.7, popup=None, popup_template=None):
     """
-    Get route coordinates and duration using OSRM routing service
+    Build one GeoJSON map layer for all stations instead of a marker per station
     
     Args:
-        station_coords (list): [station_id, latitude, longitude] of destination
-        user_location (list): [latitude, longitude] of user
+        data (pandas.DataFrame): Joined station data
+        radius (int): Circle marker radius in pixels
+        fill_opacity (float): Circle marker fill opacity
+        popup (folium.GeoJsonPopup): Popup built from feature properties on click
+        popup_template (str): HTML with {field} placeholders rendered in the
+            browser on click, used instead of popup
         
     Returns:
-        tuple: (coordinates_list, duration_string)
+        folium.GeoJson: Station layer to add to a map
     """
-    try:
-        # OSRM demo server - for production, consider using your own instance
-        osrm_url = "http://router.project-osrm.org/route/v1/walking"
-        
-        # Format coordinates for OSRM (longitude,latitude)
-        start_coords = f"{user_location[1]},{user_location[0]}"
-        end_coords = f"{station_coords[2]},{station_coords[1]}"
-        
-        # Build request URL
-        request_url = f"{osrm_url}/{start_coords};{end_coords}?overview=full&geometries=geojson"
+    on_each_feature = None
+    if popup_template is not None:
+        on_each_feature = folium.JsCode(
+            "function(feature, layer) {%s\n            }" % _popup_binding(popup_template)
+        )
+    
+    return folium.GeoJson(
+        station_features(data),
+        marker=folium.CircleMarker(radius=radius, fill=True, fill_opacity=fill_opacity),
+        style_function=_station_style,
+        popup=popup,
+        on_each_feature=on_each_feature
+    )
+
+def get_station_geometry(url):
+    """
+    Get the static station points for the current station_information snapshot
+    
+    Args:
+        url (str): API endpoint URL for station information
         
-        response = requests.get(request_url, timeout=10)
-        response.raise_for_status()
+    Returns:
+        dict or None: FeatureCollection with station_id and name properties
+            (counts are placeholders filled in by station_availability_layer),
+            None if station information is unavailable
+    """
+    try:
+        stations = load_station_information_frame(url)
+    except (requests.RequestException, KeyError, ValueError):
+        return None
+    
+    cached = _station_geometries.get(url)
+    if cached and cached[0] is stations:
+        return cached[1]
+    
+    lons = np.round(stations['lon'].to_numpy(dtype=np.float64), 6).tolist()
+    lats = np.round(stations['lat'].to_numpy(dtype=np.float64), 6).tolist()
+    columns = zip(stations['station_id'].astype(str).tolist(), stations['name'].astype(str).tolist(), lons, lats)
+    
+    geometry = {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                'properties': {
+                    'station_id': station_id,
+                    'name': name,
+                    'num_bikes_available': 0,
+                    'ebike': 0,
+                    'mechanical': 0,
+                    'num_docks_available': 0
+                }
+            }
+            for station_id, name, lon, lat in columns
+        ]
+    }
+    _station_geometries[url] = (stations, geometry)
+    return geometry
+
+def station_base_layer(geometry, radius=3, popup=None, popup_template=None):
+    """
+    Build the static station layer that availability updates are applied to
+    
+    Markers start hidden and register themselves by station_id so a
+    station_availability_layer can restyle them without reloading the map.
+    
+    Args:
+        geometry (dict): FeatureCollection from get_station_geometry
+        radius (int): Circle marker radius in pixels
+        popup (folium.GeoJsonPopup): Popup built from feature properties on click
+        popup_template (str): HTML with {field} placeholders rendered in the
+            browser on click, used instead of popup
         
-        route_data = response.json()
+    Returns:
+        folium.GeoJson: Station layer to add to a map
+    """
+    return folium.GeoJson(
+        geometry,
+        marker=folium.CircleMarker(radius=0, fill=True, opacity=0, fill_opacity=0),
+        popup=popup,
+        on_each_feature=folium.JsCode(
+            """
+            function(feature, layer) {
+                window.stationMarkers = window.stationMarkers || {};
+                window.stationMarkers[feature.properties.station_id] = layer;%s
+            }
+            """ % _popup_binding(popup_template)
+        )
+    )
+
+class StationAvailability(MacroElement):
+    """
+    Script that restyles the base layer markers from current station counts
+    
+    Counts are sent as [bikes, ebikes, mechanical, docks] per station_id;
+    stations without counts (inactive or removed) are hidden.
+    """
+    
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        (function() {
+            var counts = {{ this.counts|tojson }};
+            var markers = window.stationMarkers || {};
+            for (var stationId in markers) {
+                var layer = markers[stationId];
+                var station = counts[stationId];
+                if (!station) {
+                    layer.setRadius(0);
+                    layer.setStyle({opacity: 0, fillOpacity: 0});
+                    continue;
+                }
+                var color = station[0] >= 5 ? 'green' : (station[0] >= 1 ? 'orange' : 'red');
+                Object.assign(layer.feature.properties, {
+                    num_bikes_available: station[0],
+                    ebike: station[1],
+                    mechanical: station[2],
+                    num_docks_available: station[3]
+                });
+                layer.setRadius({{ this.radius }});
+                layer.setStyle({
+                    color: color,
+                    fillColor: color,
+                    opacity: 1,
+                    fillOpacity: {{ this.fill_opacity }}
+                });
+            }
+        })();
+        {% endmacro %}
+        """
+    )
+    
+    def __init__(self, counts, radius=3, fill_opacity=0.7):
+        super().__init__()
+        self._name = 'StationAvailability'
+        self.counts = counts
+        self.radius = radius
+        self.fill_opacity = fill_opacity
+
+def cluster_stations(data, zoom):
+    """
+    Aggregate stations into a grid sized for a map zoom level
+    
+    Args:
+        data (pandas.DataFrame): Joined station data
+        zoom (int): Map zoom level
         
-        if route_data['code'] == 'Ok' and route_data['routes']:
-            route = route_data['routes'][0]
-            
-            # Extract coordinates (convert from [lon, lat] to [lat, lon])
-            coordinates = [
-                [coord[1], coord[0]] 
-                for coord in route['geometry']['coordinates']
-            ]
-            
-            # Calculate duration in minutes
-            duration_seconds = route['duration']
-            duration_minutes = int(duration_seconds / 60)
-            
-            if duration_minutes < 1:
-                duration_str = "< 1 min"
-            else:
-                duration_str = f"{duration_minutes} min"
-            
-            return coordinates, duration_str
-        else:
-            # Fallback: return straight line
-            return [user_location, [station_coords[1], station_coords[2]]], "N/A"
-            
-    except Exception as e:
-        st.warning(f"Could not calculate route: {str(e)}")
-        # Fallback: return straight line between points
-        return [user_location, [station_coords[1], station_coords[2]]], "N/A"
+    Returns:
+        pandas.DataFrame: One row per non-empty cell with the station 'lat'/'lon'
+            centroid, 'stations' and summed 'num_bikes_available', 'ebike',
+            'mechanical' and 'num_docks_available'
+    """
+    lats = data['lat'].to_numpy(dtype=np.float64)
+    lons = data['lon'].to_numpy(dtype=np.float64)
+    if len(lats) == 0:
+        return pd.DataFrame(columns=['lat', 'lon', 'stations', 'num_bikes_available', 'ebike', 'mechanical', 'num_docks_available'])
+    
+    # Web Mercator ground resolution at the network's latitude
+    cos_lat = np.cos(np.radians(lats.mean()))
+    cell_km = STATION_CLUSTER_CELL_PX * WEB_MERCATOR_M_PER_PX * cos_lat / 2 ** zoom / 1000
+    cell_lat = cell_km / KM_PER_DEGREE_LAT
+    cell_lon = cell_lat / cos_lat
+    
+    rows = np.floor(lats / cell_lat).astype(np.int64)
+    cols = np.floor(lons / cell_lon).astype(np.int64)
+    _, cells = np.unique(np.stack([rows, cols], axis=1), axis=0, return_inverse=True)
+    cells = cells.ravel()
+    
+    stations = np.bincount(cells)
+    clusters = {
+        'lat': np.bincount(cells, weights=lats) / stations,
+        'lon': np.bincount(cells, weights=lons) / stations,
+        'stations': stations
+    }
+    for column in ['num_bikes_available', 'ebike', 'mechanical', 'num_docks_available']:
+        clusters[column] = np.bincount(cells, weights=data[column].to_numpy()).astype(np.int64)
+    return pd.DataFrame(clusters)
+
+class StationClusters(MacroElement):
+    """
+    Script that draws station clusters into its parent feature group
+    
+    Clusters are sent as [lat, lon, stations, bikes, ebikes, docks]; marker
+    size grows with the number of stations and the colour follows
+    get_marker_color applied to the average bikes per station.
+    """
+    
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        (function() {
+            var clusters = {{ this.clusters|tojson }};
+            clusters.forEach(function(cluster) {
+                var perStation = cluster[3] / cluster[2];
+                var color = perStation >= 5 ? 'green' : (perStation >= 1 ? 'orange' : 'red');
+                L.circleMarker([cluster[0], cluster[1]], {
+                    radius: 6 + 2 * Math.sqrt(cluster[2]),
+                    color: color,
+                    fillColor: color,
+                    fillOpacity: 0.6,
+                    weight: 2
+                }).bindTooltip(
+                    cluster[2] + ' stations<br>' + cluster[3] + ' bikes (' + cluster[4] + ' e-bikes)<br>' + cluster[5] + ' docks'
+                ).addTo({{ this._parent.get_name() }});
+            });
+        })();
+        {% endmacro %}
+        """
+    )
+    
+    def __init__(self, clusters):
+        super().__init__()
+        self._name = 'StationClusters'
+        self.clusters = [
+            list(row) for row in zip(
+                np.round(clusters['lat'].to_numpy(), 5).tolist(), np.round(clusters['lon'].to_numpy(), 5).tolist(),
+                clusters['stations'].tolist(), clusters['num_bikes_available'].tolist(),
+                clusters['ebike'].tolist(), clusters['num_docks_available'].tolist()
+            )
+        ]
 
-def format_station_popup(station_data):
+def station_availability_layer(data, radius=3, fill_opacity=0.7, zoom=None):
     """
-    Format station information for map popup
+    Build the small per-refresh availability layer for station_base_layer
+    
+    Pass it to st_folium as feature_group_to_add so a refresh only patches
+    marker colours and counts in the browser. Below STATION_CLUSTER_MAX_ZOOM
+    the station markers are hidden and grid clusters are sent instead, so
+    the layer stays small however many stations there are.
     
     Args:
-        station_data (pandas.Series): Station data row
+        data (pandas.DataFrame): Joined station data
+        radius (int): Circle marker radius in pixels
+        fill_opacity (float): Circle marker fill opacity
+        zoom (int): Current map zoom, None to always show stations
         
     Returns:
-        str: Formatted HTML string for popup
+        folium.FeatureGroup: Availability layer
     """
-    return f"""
-    <div style="font-family: Arial, sans-serif;">
-        <h4>{station_data.get('name', 'Station')}</h4>
-        <p><strong>Station ID:</strong> {station_data['station_id']}</p>
-        <p><strong>Total Bikes:</strong> {station_data['num_bikes_available']}</p>
-        <p><strong>Mechanical Bikes:</strong> {station_data['mechanical']}</p>
-        <p><strong>E-Bikes:</strong> {station_data['ebike']}</p>
-        <p><strong>Available Docks:</strong> {station_data['num_docks_available']}</p>
-        <p><strong>Capacity:</strong> {station_data.get('capacity', 'N/A')}</p>
-    </div>
-    """
\ No newline at end of file
+    layer = folium.FeatureGroup(name='Availability')
+    
+    if zoom is not None and zoom < STATION_CLUSTER_MAX_ZOOM:
+        StationClusters(cluster_stations(data, zoom)).add_to(layer)
+        StationAvailability({}, radius, fill_opacity).add_to(layer)
+        return layer
+    
+    station_ids = data['station_id'].astype(str).tolist()
+    stock = zip(
+        data['num_bikes_available'].tolist(), data['ebike'].tolist(),
+        data['mechanical'].tolist(), data['num_docks_available'].tolist()
+    )
+    counts = {station_id: list(row) for station_id, row in zip(station_ids, stock)}
+    
+    StationAvailability(counts, radius, fill_opacity).add_to(layer)
+    return layer
@@ -473,6 +473,18 @@ st.markdown("""
 STATION_STATUS_URL = 'https://tor.publicbikesystem.net/ube/gbfs/v1/en/station_status.json'
 STATION_INFO_URL = "https://tor.publicbikesystem.net/ube/gbfs/v1/en/station_information"
 
+# Vintage-styled station popup, rendered in the browser from each station's properties
+VINTAGE_POPUP_TEMPLATE = (
+    '<div style="font-family: \'Crimson Text\', serif; min-width: 200px; background: #FAF7F0; padding: 12px; border: 2px solid #2C2416;">'
+    '<h4 style="font-family: \'Bebas Neue\', sans-serif; margin: 0 0 8px 0; color: #2E5C8A; text-transform: uppercase;">{name}</h4>'
+    '<div style="border-bottom: 1px solid #2C2416; margin: 8px 0;"></div>'
+    '<p style="margin: 4px 0; font-size: 0.9rem;"><strong>Total Bicycles:</strong> {num_bikes_available}</p>'
+    '<p style="margin: 4px 0; font-size: 0.9rem;"><strong>Electric:</strong> {ebike}</p>'
+    '<p style="margin: 4px 0; font-size: 0.9rem;"><strong>Traditional:</strong> {mechanical}</p>'
+    '<p style="margin: 4px 0; font-size: 0.9rem;"><strong>Docking Space:</strong> {num_docks_available}</p>'
+    '</div>'
+)
+
 def get_consistent_toronto_time():
     """
     Get Toronto time that's consistent across local and Streamlit Cloud
@@ -537,15 +549,14 @@ def create_story_introduction():
     </div>
     ''', unsafe_allow_html=True)
 
-def create_hero_metrics(data):
+def create_hero_metrics(metrics):
     """Create hero metric cards with asymmetrical layout"""
     
-    # Calculate metrics
-    total_bikes = data['num_bikes_available'].sum()
-    total_ebikes = data['ebike'].sum()
-    stations_with_bikes = len(data[data['num_bikes_available'] > 0])
-    stations_with_docks = len(data[data['num_docks_available'] > 0])
-    total_stations = len(data)
+    # Metrics are precomputed with each snapshot
+    total_bikes = metrics['total_bikes']
+    total_ebikes = metrics['total_ebikes']
+    stations_with_bikes = metrics['stations_with_bikes']
+    stations_with_docks = metrics['stations_with_docks']
     
     st.markdown('<div class="section-header">Current Fleet Status</div>', unsafe_allow_html=True)
     
@@ -562,7 +573,7 @@ def create_hero_metrics(data):
         ''', unsafe_allow_html=True)
     
     with col2:
-        availability_rate = (stations_with_bikes / total_stations) * 100
+        availability_rate = metrics['bike_availability_rate']
         st.markdown(f'''
         <div class="paper-card card-success offset-right">
             <div class="hero-label">Active Stations</div>
@@ -575,7 +586,7 @@ def create_hero_metrics(data):
     col3, col4 = st.columns([1, 1])
     
     with col3:
-        stations_with_ebikes = len(data[data['ebike'] > 0])
+        stations_with_ebikes = metrics['stations_with_ebikes']
         st.markdown(f'''
         <div class="paper-card card-warning offset-left">
             <div class="hero-label">Electric Bicycles</div>
@@ -585,7 +596,7 @@ def create_hero_metrics(data):
         ''', unsafe_allow_html=True)
     
     with col4:
-        dock_rate = (stations_with_docks / total_stations) * 100
+        dock_rate = metrics['dock_availability_rate']
         st.markdown(f'''
         <div class="paper-card card-alert">
             <div class="hero-label">Docking Facilities</div>
@@ -630,7 +641,7 @@ def create_sidebar_journey_finder(data):
     # Action selection with vintage buttons
     st.sidebar.markdown('<div style="font-family: \'Bebas Neue\', sans-serif; font-size: 1.2rem; text-transform: uppercase; letter-spacing: 0.1em; color: #2C2416; margin-bottom: 1rem;">Type of Adventure</div>', unsafe_allow_html=True)
     
-    col1, col2 = st.sidebar.columns(2)
+    col1, col2, col3 = st.sidebar.columns(3)
     with col1:
         if st.button("🚲 Rent", key="rent_btn", use_container_width=True):
             st.session_state.action = "rent"
@@ -639,10 +650,16 @@ def create_sidebar_journey_finder(data):
         if st.button("🔒 Return", key="return_btn", use_container_width=True):
             st.session_state.action = "return"
     
+    with col3:
+        if st.button("🗺️ Trip", key="trip_btn", use_container_width=True):
+            st.session_state.action = "trip"
+    
     # Show current selection with vintage styling
     current_action = st.session_state.get('action', 'rent')
     if current_action == 'rent':
         st.sidebar.markdown('<div style="background: #4A7C59; color: #FAF7F0; padding: 0.75rem; border-radius: 8px; text-align: center; font-family: \'Bebas Neue\', sans-serif; text-transform: uppercase; letter-spacing: 0.05em; margin: 1rem 0;">🚲 Renting a Bicycle</div>', unsafe_allow_html=True)
+    elif current_action == 'trip':
+        st.sidebar.markdown('<div style="background: #B67C6D; color: #FAF7F0; padding: 0.75rem; border-radius: 8px; text-align: center; font-family: \'Bebas Neue\', sans-serif; text-transform: uppercase; letter-spacing: 0.05em; margin: 1rem 0;">🗺️ Riding Across Town</div>', unsafe_allow_html=True)
     else:
         st.sidebar.markdown('<div style="background: #2E5C8A; color: #FAF7F0; padding: 0.75rem; border-radius: 8px; text-align: center; font-family: \'Bebas Neue\', sans-serif; text-transform: uppercase; letter-spacing: 0.05em; margin: 1rem 0;">🔒 Returning a Bicycle</div>', unsafe_allow_html=True)
     
@@ -666,8 +683,19 @@ def create_sidebar_journey_finder(data):
     with col2:
         province = st.sidebar.text_input("Province", value="Ontario", disabled=True, label_visibility="collapsed")
     
-    # Bike type selection (only for rent)
-    if current_action == 'rent':
+    # Destination (only for trips)
+    destination = ""
+    if current_action == 'trip':
+        st.sidebar.markdown('<div style="font-family: \'Bebas Neue\', sans-serif; font-size: 1.2rem; text-transform: uppercase; letter-spacing: 0.1em; color: #2C2416; margin: 1rem 0;">Your Destination</div>', unsafe_allow_html=True)
+        destination = st.sidebar.text_input(
+            "Destination Address",
+            placeholder="100 Queen Street West, Toronto",
+            help="Enter where you are riding to in Toronto",
+            label_visibility="collapsed"
+        )
+    
+    # Bike type selection (only when renting)
+    if current_action in ('rent', 'trip'):
         st.sidebar.markdown("---")
         st.sidebar.markdown('<div style="font-family: \'Bebas Neue\', sans-serif; font-size: 1.2rem; text-transform: uppercase; letter-spacing: 0.1em; color: #2C2416; margin-bottom: 1rem;">Bicycle Preference</div>', unsafe_allow_html=True)
         
@@ -711,14 +739,21 @@ def create_sidebar_journey_finder(data):
     ''', unsafe_allow_html=True)
     
     # Action button with vintage styling
-    action_text = "🗺️ Chart My Course" if current_action == 'rent' else "🎯 Find My Dock"
+    action_text = {'rent': "🗺️ Chart My Course", 'trip': "🧭 Plan My Trip"}.get(current_action, "🎯 Find My Dock")
     
     if st.sidebar.button(action_text, key="journey_btn", use_container_width=True, type="primary"):
-        if address.strip():
-            with st.spinner(f'🔍 Plotting your urban adventure...'):
-                process_location_request(address, city, province, current_action, data)
-        else:
+        if not address.strip():
             st.sidebar.error("📍 Please provide your starting location")
+        elif current_action == 'trip' and not destination.strip():
+            st.sidebar.error("🏁 Please provide your destination")
+        else:
+            process_location_request(address, city, province, current_action, destination)
+    else:
+        # Drop a pending request once the traveller changes its inputs
+        cancel_stale_location_request(address, city, province, current_action, destination)
+    
+    # Results fill in as the background geocode and route calls finish
+    show_location_result(data)
     
     # Vintage help section
     st.sidebar.markdown("---")
@@ -740,59 +775,186 @@ def create_sidebar_journey_finder(data):
     </div>
     ''', unsafe_allow_html=True)
 
-def process_location_request(address, city, province, action, data):
-    """Process location request and show results"""
-    full_address = f"{address} {city} {province}"
+def location_request_mode(action):
+    """Availability mode for a rent, return or trip request"""
+    if action in ("rent", "trip"):
+        # Selected bike type from session state ('any', 'ebike' or 'mechanical')
+        return st.session_state.get('bike_type', 'any')
+    return 'dock'
+
+def location_request_inputs(address, city, province, action, destination=""):
+    """The inputs a location request is started from, to tell when they change"""
+    full_destination = f"{destination} {city} {province}" if action == 'trip' else None
+    return (f"{address} {city} {province}", location_request_mode(action), action, full_destination)
+
+def process_location_request(address, city, province, action, destination=""):
+    """Start a location request; geocoding and routing run in the background"""
+    inputs = location_request_inputs(address, city, province, action, destination)
+    full_address, mode, _, full_destination = inputs
     
-    with st.spinner(f"🔍 Finding your {'bike' if action == 'rent' else 'dock'}..."):
-        try:
-            user_location = geocode(full_address)
-            if not user_location:
-                st.sidebar.error("❌ Could not find the address. Please check and try again.")
-                return
+    previous = st.session_state.get('journey')
+    if previous is not None:
+        cancel_journey(previous)
+    
+    if action == 'trip':
+        journey = start_trip(full_address, full_destination, mode)
+    else:
+        journey = start_journey(full_address, mode)
+    journey['action'] = action
+    journey['inputs'] = inputs
+    st.session_state.journey = journey
+
+def cancel_stale_location_request(address, city, province, action, destination=""):
+    """Cancel the current location request if its inputs have changed"""
+    journey = st.session_state.get('journey')
+    if journey is None:
+        return
+    
+    if journey['inputs'] != location_request_inputs(address, city, province, action, destination):
+        cancel_journey(journey)
+        del st.session_state['journey']
+
+def show_location_result(data):
+    """Show the current location request, polling it while jobs are pending"""
+    journey = st.session_state.get('journey')
+    if journey is None:
+        return
+    
+    # A request that failed while rendering only shows why
+    if journey['error'] is not None and journey['error'] not in JOURNEY_ERRORS:
+        st.error(f"❌ Error: {journey['error']}")
+        return
+    
+    # Sidebar notes reflect the request as of this app run (fragments cannot write to the sidebar)
+    action = journey['action']
+    if action == 'trip':
+        show_trip_notes(journey)
+    elif journey['error'] == 'address':
+        st.sidebar.error("❌ Could not find the address. Please check and try again.")
+    elif journey['error'] == 'stations':
+        st.sidebar.error("❌ The station registry could not be consulted. Please try again.")
+    elif journey['candidates'] == []:
+        bike_type_text = st.session_state.get('bike_type', 'mechanical')
+        if action == 'rent':
+            st.sidebar.warning(f"⚠️ No {bike_type_text} {'bikes' if action == 'rent' else 'docks'} available nearby. Try selecting a different bike type.")
+        else:
+            st.sidebar.warning(f"⚠️ No {'bikes' if action == 'rent' else 'docks'} available nearby.")
+    elif journey['route'] is not None:
+        st.sidebar.success("✅ Perfect! Route plotted successfully.")
+    
+    # Only the route section reruns while waiting on the background jobs
+    pending = trip_pending(journey) if action == 'trip' else journey_pending(journey)
+    journey['interval'] = JOURNEY_POLL_SECONDS if pending else None
+    st.fragment(render_location_result, run_every=journey['interval'])(data)
+
+def show_trip_notes(trip):
+    """Sidebar notes for a trip request"""
+    if trip['error'] == 'origin':
+        st.sidebar.error("❌ Could not find your starting address. Please check and try again.")
+    elif trip['error'] == 'destination':
+        st.sidebar.error("❌ Could not find your destination. Please check and try again.")
+    elif trip['error'] == 'stations':
+        st.sidebar.error("❌ The station registry could not be consulted. Please try again.")
+    elif trip['plan'] is False:
+        st.sidebar.warning("⚠️ No bikes near your start or no docks near your destination right now.")
+    elif trip['routes'] is not None:
+        st.sidebar.success("✅ Perfect! Trip plotted successfully.")
+
+def render_location_result(data):
+    """Render the location request as far as it has got"""
+    journey = st.session_state.get('journey')
+    if journey is None:
+        return
+    
+    try:
+        # Spatial index for the current station_information snapshot
+        index = get_station_index(STATION_INFO_URL)
+        if journey['action'] == 'trip':
+            pending = poll_trip(journey, data, index, wait=JOURNEY_POLL_SECONDS)
             
-            if action == "rent":
-                # Get selected bike type from session state
-                bike_type = st.session_state.get('bike_type', 'any')
-                if bike_type == 'ebike':
-                    chosen_station = get_bike_availability(user_location, data, ["ebike"])
-                elif bike_type == 'mechanical':
-                    chosen_station = get_bike_availability(user_location, data, ["mechanical"])
-                else:  # any
-                    chosen_station = get_bike_availability(user_location, data, ["mechanical", "ebike"])
-            else:
-                chosen_station = get_dock_availability(user_location, data)
+            if journey['error'] is None and journey['plan'] is None:
+                st.info("🔍 Plotting your journey across town...")
+            elif journey['plan']:
+                display_trip_result(journey, data, index)
+        else:
+            pending = poll_journey(journey, data, index, wait=JOURNEY_POLL_SECONDS)
             
-            if chosen_station:
-                display_route_result(user_location, chosen_station, data, action)
-            else:
-                bike_type_text = st.session_state.get('bike_type', 'mechanical')
-                if action == 'rent':
-                    st.sidebar.warning(f"⚠️ No {bike_type_text} {'bikes' if action == 'rent' else 'docks'} available nearby. Try selecting a different bike type.")
-                else:
-                    st.sidebar.warning(f"⚠️ No {'bikes' if action == 'rent' else 'docks'} available nearby.")
-                
-        except Exception as e:
-            st.sidebar.error(f"❌ Error: {str(e)}")
+            if journey['error'] is None and journey['candidates'] is None:
+                st.info("🔍 Plotting your urban adventure...")
+            elif journey['candidates']:
+                best = journey['candidates'][0]
+                chosen_station = [best['station_id'], best['lat'], best['lon']]
+                display_route_result(journey['location'], chosen_station, data, journey['action'], index, journey['route'])
+                display_station_options(journey['candidates'], data, journey['action'])
+    except Exception as e:
+        # Record the failure so the rerun below shows it instead of polling again
+        fail_journey(journey, str(e))
+        st.error(f"❌ Error: {journey['error']}")
+        pending = False
+    
+    # Finished: rerun the app once so this section stops polling
+    if not pending and journey.get('interval') is not None:
+        st.rerun()
 
-def display_route_result(user_location, chosen_station, data, action):
-    """Display route result with map in main area"""
+def display_station_options(candidates, data, action):
+    """Display the ranked station options as a vintage timetable"""
     
-    # Show success message in sidebar
-    st.sidebar.success(f"✅ Perfect! Route plotted successfully.")
+    # A candidate can drop out of a later snapshot while the result is still shown
+    rows = data[data['station_id'].isin([c['station_id'] for c in candidates])].set_index('station_id')
+    
+    rows_html = ""
+    for rank, candidate in enumerate(candidates, start=1):
+        if candidate['station_id'] not in rows.index:
+            rows_html += f'<p style="margin: 0.5rem 0;"><strong>{rank}. Station {candidate["station_id"]}</strong><br>⚠️ No longer reported</p>'
+            continue
+        
+        row = rows.loc[candidate['station_id']]
+        walk_time = format_duration(candidate['walk_seconds'])
+        
+        if action == 'rent':
+            stock = f"{row['num_bikes_available']} bicycles ({row['ebike']} electric)"
+        else:
+            stock = f"{row['num_docks_available']} docking spaces"
+        if candidate.get('probability') is not None:
+            stock += f" • {candidate['probability']:.0%} likely on arrival"
+        
+        name = row.get('name', candidate['station_id'])
+        distance = candidate['distance_km']
+        
+        # Single line per option so the markdown HTML block isn't broken by blank lines
+        rows_html += f'<p style="margin: 0.5rem 0;"><strong>{rank}. {name}</strong><br>🚶 {walk_time} on foot ({distance:.2f} km) • {stock}</p>'
+    
+    st.markdown(f'''
+    <div class="paper-card card-primary">
+        <div class="hero-label">Your Best Departures</div>
+        <div style="font-family: 'Crimson Text', serif; font-size: 1.05rem; line-height: 1.6;">
+            {rows_html}
+        </div>
+    </div>
+    ''', unsafe_allow_html=True)
+
+def display_route_result(user_location, chosen_station, data, action, index=None, route=None):
+    """Display route result with map in main area; route is None while it is still being computed"""
     
     # Display detailed results in main area
     st.markdown('<div class="section-header">Your Urban Adventure Route</div>', unsafe_allow_html=True)
     
-    # Get station details
-    station_row = data[data['station_id'] == chosen_station[0]].iloc[0]
-    station_name = station_row.get('name', f"Station {chosen_station[0]}")
+    # Get station details; the station may have dropped out of a later snapshot
+    matches = data[data['station_id'] == chosen_station[0]]
+    station_row = matches.iloc[0] if len(matches) else None
+    if station_row is None:
+        station_name = f"Station {chosen_station[0]}"
+        stock = '⚠️ Station no longer reported'
+    else:
+        station_name = station_row.get('name', f"Station {chosen_station[0]}")
+        stock = f"🚲 Bikes Available: {station_row['num_bikes_available']}" if action == 'rent' else f"🔒 Docks Available: {station_row['num_docks_available']}"
     
-    # Calculate route
-    try:
-        coordinates, duration = run_osrm(chosen_station, user_location)
-    except:
-        duration = "N/A"
+    # Walking route, a straight line until it is ready or if it failed
+    if route:
+        coordinates, duration = route['coordinates'], format_duration(route['duration'])
+    else:
+        coordinates = [user_location, [chosen_station[1], chosen_station[2]]]
+        duration = "Calculating..." if route is None else "N/A"
     
     # Route summary card
     st.markdown(f'''
@@ -804,7 +966,7 @@ def display_route_result(user_location, chosen_station, data, action):
             <strong>Action:</strong> {'Rent your bicycle' if action == 'rent' else 'Return your bicycle'}
         </div>
         <div style="font-family: 'Bebas Neue', sans-serif; font-size: 1rem; text-transform: uppercase; letter-spacing: 0.1em; color: #4A7C59;">
-            {'🚲 Bikes Available: ' + str(station_row['num_bikes_available']) if action == 'rent' else '🔒 Docks Available: ' + str(station_row['num_docks_available'])}
+            {stock}
         </div>
     </div>
     ''', unsafe_allow_html=True)
@@ -812,31 +974,9 @@ def display_route_result(user_location, chosen_station, data, action):
     # Create route map
     m = folium.Map(location=user_location, zoom_start=16, tiles='cartodbpositron')
     
-    # Add all stations with vintage styling
-    for _, row in data.iterrows():
-        marker_color = get_marker_color(row['num_bikes_available'])
-        
-        # Vintage-styled popup
-        popup_html = f"""
-        <div style="font-family: 'Crimson Text', serif; min-width: 200px; background: #FAF7F0; padding: 12px; border: 2px solid #2C2416;">
-            <h4 style="font-family: 'Bebas Neue', sans-serif; margin: 0 0 8px 0; color: #2E5C8A; text-transform: uppercase;">{row.get('name', row['station_id'])}</h4>
-            <div style="border-bottom: 1px solid #2C2416; margin: 8px 0;"></div>
-            <p style="margin: 4px 0; font-size: 0.9rem;"><strong>Total Bicycles:</strong> {row['num_bikes_available']}</p>
-            <p style="margin: 4px 0; font-size: 0.9rem;"><strong>Electric:</strong> {row['ebike']}</p>
-            <p style="margin: 4px 0; font-size: 0.9rem;"><strong>Traditional:</strong> {row['mechanical']}</p>
-            <p style="margin: 4px 0; font-size: 0.9rem;"><strong>Docking Space:</strong> {row['num_docks_available']}</p>
-        </div>
-        """
-        
-        folium.CircleMarker(
-            location=[row['lat'], row['lon']],
-            radius=4,
-            color=marker_color,
-            fill=True,
-            fill_color=marker_color,
-            fill_opacity=0.8,
-            popup=folium.Popup(popup_html, max_width=250)
-        ).add_to(m)
+    # Add the stations around the route with vintage styling
+    nearby = stations_near_route(user_location, [chosen_station[1], chosen_station[2]], data, index)
+    station_layer(nearby, radius=4, fill_opacity=0.8, popup_template=VINTAGE_POPUP_TEMPLATE).add_to(m)
     
     # Add user location and destination
     folium.Marker(
@@ -866,7 +1006,77 @@ def display_route_result(user_location, chosen_station, data, action):
     st_folium(m, width=None, height=500, returned_objects=[], use_container_width=True)
     st.markdown('</div>', unsafe_allow_html=True)
 
-def create_network_map(data):
+def display_trip_result(trip, data, index=None):
+    """Display a trip plan with map in main area; each leg is a straight line until its route is ready"""
+    plan, routes = trip['plan'], trip['routes'] or {}
+    pickup = [plan['pickup']['lat'], plan['pickup']['lon']]
+    dropoff = [plan['dropoff']['lat'], plan['dropoff']['lon']]
+    
+    st.markdown('<div class="section-header">Your Journey Across Town</div>', unsafe_allow_html=True)
+    
+    # Get station details; either station may have dropped out of a newer snapshot since the plan was made
+    names = data.set_index('station_id')['name']
+    pickup_name = names.get(plan['pickup']['station_id'])
+    dropoff_name = names.get(plan['dropoff']['station_id'])
+    if pickup_name is None or dropoff_name is None:
+        st.warning("⚠️ A station on this journey is no longer reported. Plan the trip again for a fresh route.")
+    pickup_name = pickup_name if pickup_name is not None else f"Station {plan['pickup']['station_id']}"
+    dropoff_name = dropoff_name if dropoff_name is not None else f"Station {plan['dropoff']['station_id']}"
+    confidence = f"{plan['probability']:.0%} likely a bicycle and a dock await you" if plan['probability'] is not None else "Live availability"
+    
+    # Trip summary card
+    st.markdown(f'''
+    <div class="paper-card card-success">
+        <div class="hero-label">Journey Summary</div>
+        <div style="font-family: 'Crimson Text', serif; font-size: 1.2rem; line-height: 1.8; margin: 1rem 0;">
+            <strong>Collect at:</strong> {pickup_name} ({format_duration(plan['walk_to_seconds'])} on foot)<br>
+            <strong>Ride to:</strong> {dropoff_name} ({format_duration(plan['ride_seconds'])} by bicycle)<br>
+            <strong>Then walk:</strong> {format_duration(plan['walk_from_seconds'])} to your destination
+        </div>
+        <div style="font-family: 'Bebas Neue', sans-serif; font-size: 1rem; text-transform: uppercase; letter-spacing: 0.1em; color: #4A7C59;">
+            ⏱️ About {format_duration(plan['total_seconds'])} door to door • {confidence}
+        </div>
+    </div>
+    ''', unsafe_allow_html=True)
+    
+    # Create trip map
+    m = folium.Map(location=trip['origin'], zoom_start=14, tiles='cartodbpositron')
+    m.fit_bounds([trip['origin'], trip['destination'], pickup, dropoff])
+    
+    # Add the stations around both ends of the trip with vintage styling
+    nearby = pd.concat([
+        stations_near_route(trip['origin'], pickup, data, index),
+        stations_near_route(dropoff, trip['destination'], data, index)
+    ]).drop_duplicates(subset='station_id')
+    station_layer(nearby, radius=4, fill_opacity=0.8, popup_template=VINTAGE_POPUP_TEMPLATE).add_to(m)
+    
+    # Add both ends and the two stations
+    folium.Marker(trip['origin'], popup="📍 Your Starting Point", icon=folium.Icon(color="blue", icon="user")).add_to(m)
+    folium.Marker(pickup, popup="🚲 Get Your Bike Here", icon=folium.Icon(color="red", icon="bicycle")).add_to(m)
+    folium.Marker(dropoff, popup="🔒 Return Your Bike Here", icon=folium.Icon(color="green", icon="lock")).add_to(m)
+    folium.Marker(trip['destination'], popup="🏁 Your Destination", icon=folium.Icon(color="darkblue", icon="flag")).add_to(m)
+    
+    # Walk, ride, walk; straight lines until the routes are ready or if they failed
+    for leg, start, end, color in (
+        ('walk_to', trip['origin'], pickup, "#2E5C8A"),
+        ('ride', pickup, dropoff, "#B67C6D"),
+        ('walk_from', dropoff, trip['destination'], "#2E5C8A")
+    ):
+        route = routes.get(leg)
+        folium.PolyLine(
+            route['coordinates'] if route else [start, end],
+            color=color,
+            weight=4,
+            opacity=0.8,
+            dash_array="10,5"
+        ).add_to(m)
+    
+    # Display in heritage frame
+    st.markdown('<div class="heritage-frame">', unsafe_allow_html=True)
+    st_folium(m, width=None, height=500, returned_objects=[], use_container_width=True)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def create_network_map(data, metrics):
     """Create heritage-framed network map"""
     
     st.markdown('<div class="section-header">The Great Toronto Cycling Network</div>', unsafe_allow_html=True)
@@ -882,35 +1092,21 @@ def create_network_map(data):
     center = [43.65306613746548, -79.38815311015]
     m = folium.Map(location=center, zoom_start=12, tiles='cartodbpositron')
     
-    # Add station markers
-    for _, row in data.iterrows():
-        marker_color = get_marker_color(row['num_bikes_available'])
-        
-        # Vintage-styled popup
-        popup_html = f"""
-        <div style="font-family: 'Crimson Text', serif; min-width: 200px; background: #FAF7F0; padding: 12px; border: 2px solid #2C2416;">
-            <h4 style="font-family: 'Bebas Neue', sans-serif; margin: 0 0 8px 0; color: #2E5C8A; text-transform: uppercase;">{row.get('name', row['station_id'])}</h4>
-            <div style="border-bottom: 1px solid #2C2416; margin: 8px 0;"></div>
-            <p style="margin: 4px 0; font-size: 0.9rem;"><strong>Total Bicycles:</strong> {row['num_bikes_available']}</p>
-            <p style="margin: 4px 0; font-size: 0.9rem;"><strong>Electric:</strong> {row['ebike']}</p>
-            <p style="margin: 4px 0; font-size: 0.9rem;"><strong>Traditional:</strong> {row['mechanical']}</p>
-            <p style="margin: 4px 0; font-size: 0.9rem;"><strong>Docking Space:</strong> {row['num_docks_available']}</p>
-        </div>
-        """
-        
-        folium.CircleMarker(
-            location=[row['lat'], row['lon']],
-            radius=4,
-            color=marker_color,
-            fill=True,
-            fill_color=marker_color,
-            fill_opacity=0.8,
-            popup=folium.Popup(popup_html, max_width=250)
-        ).add_to(m)
+    # Static station layer, cached per station_information snapshot, plus a small
+    # availability layer that st_folium patches in without reloading the map
+    geometry = get_station_geometry(STATION_INFO_URL)
+    if geometry is not None:
+        station_base_layer(geometry, radius=4, popup_template=VINTAGE_POPUP_TEMPLATE).add_to(m)
+        # Clusters when zoomed out, stations when zoomed in
+        zoom = (st.session_state.get('network_map') or {}).get('zoom') or 12
+        availability = station_availability_layer(data, radius=4, fill_opacity=0.8, zoom=zoom)
+    else:
+        station_layer(data, radius=4, fill_opacity=0.8, popup_template=VINTAGE_POPUP_TEMPLATE).add_to(m)
+        availability = None
     
     # Display in heritage frame
     st.markdown('<div class="heritage-frame">', unsafe_allow_html=True)
-    st_folium(m, width=None, height=500, returned_objects=[], use_container_width=True)
+    st_folium(m, key='network_map', width=None, height=500, returned_objects=['zoom'], use_container_width=True, feature_group_to_add=availability)
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Legend with status badges
@@ -918,9 +1114,9 @@ def create_network_map(data):
     
     col1, col2, col3 = st.columns(3)
     
-    ready_stations = len(data[data['num_bikes_available'] >= 5])
-    limited_stations = len(data[(data['num_bikes_available'] >= 1) & (data['num_bikes_available'] < 5)])
-    empty_stations = len(data[data['num_bikes_available'] == 0])
+    ready_stations = metrics['ready_stations']
+    limited_stations = metrics['limited_stations']
+    empty_stations = metrics['empty_stations']
     
     with col1:
         st.markdown(f'<div class="status-badge badge-available">Abundant Supply</div>', unsafe_allow_html=True)
@@ -975,9 +1171,20 @@ def main():
     # Fetch data with vintage loading message
     with st.spinner('Consulting the great transit archives...'):
         try:
-            data_df = query_station_status(STATION_STATUS_URL)
-            latlon_df = get_station_latlon(STATION_INFO_URL)
-            data = join_latlon(data_df, latlon_df)
+            # The background poller keeps a shared snapshot fresh for every session
+            start_feed_poller(STATION_STATUS_URL, STATION_INFO_URL)
+            snapshot = get_latest_snapshot(timeout=15)
+            
+            if snapshot is not None:
+                data = snapshot['data']
+                metrics = snapshot['metrics']
+            else:
+                # No snapshot published yet, fall back to a direct fetch
+                data_df, latlon_df, errors = fetch_station_frames(STATION_STATUS_URL, STATION_INFO_URL)
+                for feed, error in errors.items():
+                    st.error(f"The transit telegraph reports trouble with station {feed}: {error}")
+                data = join_latlon(data_df, latlon_df)
+                metrics = compute_station_metrics(data)
         except Exception as e:
             st.error(f"The transit telegraph reports: {str(e)}")
             return
@@ -986,13 +1193,13 @@ def main():
     create_story_introduction()
     
     # Hero metrics with asymmetrical layout
-    create_hero_metrics(data)
+    create_hero_metrics(metrics)
     
     # Sidebar journey finder (replaces the main content journey finder)
     create_sidebar_journey_finder(data)
     
     # Network map
-    create_network_map(data)
+    create_network_map(data, metrics)
     
     # Footer
     create_footer()